@@ -8,6 +8,21 @@ var obj_count = 0;
 var boxes = [];
 var lines = [];
 
+// change tracking, see scan_changes()
+var CHANGE_LOG_SIZE = 2000;
+var patch_version = 0;
+var change_log = [];
+var known_boxes = {};
+var known_lines = {};
+
+// long walks send a progress frame every PROGRESS_INTERVAL boxes, so that
+// the Python side keeps waiting for the response
+var PROGRESS_INTERVAL = 500;
+var progress_request_id = null;
+
+// snapshot that paged get_objects_in_patch requests read from, see get_objects_page()
+var paged_snapshot = null;
+
 function safe_parse_json(str) {
     try {
         return JSON.parse(str);
@@ -41,7 +56,9 @@ function anything() {
             }
             break;
         case "get_objects_in_patch":
-            if (data.request_id) {
+            if (data.request_id && (data.limit || data.cursor)) {
+                get_objects_page(data.request_id, data.cursor, data.limit || 500);
+            } else if (data.request_id) {
                 get_objects_in_patch(data.request_id);
             } else {
                 outlet(0, "error", "Missing request_id for get_objects_in_patch");
@@ -61,71 +78,156 @@ function anything() {
                 outlet(0, "error", "Missing request_id or varname for get_object_attributes");
             }
             break;
+        case "get_patch_changes":
+            if (data.request_id) {
+                get_patch_changes(data.request_id, data.since_version || 0);
+            } else {
+                outlet(0, "error", "Missing request_id for get_patch_changes");
+            }
+            break;
         case "get_avoid_rect_position":
             if (data.request_id) {
                 get_avoid_rect_position(data.request_id);
             }
             break;
-        case "add_object":
-            if (data.obj_type && data.position && data.varname) {
-                add_object(data.position[0], data.position[1], data.obj_type, data.args, data.varname);
+        case "apply_batch":
+            if (data.request_id && data.operations) {
+                apply_batch(data.request_id, data.operations);
             } else {
-                outlet(0, "error", "Missing obj_type or position or varname for add_object");
+                outlet(0, "error", "Missing request_id or operations for apply_batch");
             }
             break;
-        case "remove_object":
-            if (data.varname) {
-                remove_object(data.varname);
+        case "set_numbers":
+        case "send_messages":
+            // many targets in one pass; acknowledged ones report each failure
+            var start = Date.now();
+            var failed;
+            if (data.action == "set_numbers") {
+                failed = data.values ? set_numbers(data.values) : [{error: "Missing values for set_numbers"}];
             } else {
-                outlet(0, "error", "Missing varname for remove_object");
+                failed = data.messages ? send_messages(data.messages) : [{error: "Missing messages for send_messages"}];
+            }
+            if (data.request_id) {
+                send_response(data.request_id, {
+                    success: failed.length == 0,
+                    error: failures_error(failed),
+                    failed: failed,
+                    elapsed_ms: Date.now() - start
+                });
+            } else if (failed.length > 0) {
+                outlet(0, "error", failures_error(failed));
             }
             break;
+        default:
+            var start = Date.now();
+            var error = run_command(data);
+            if (data.request_id) {
+                // acknowledged command: report status and execution time
+                send_response(data.request_id, {
+                    success: !error,
+                    error: error,
+                    elapsed_ms: Date.now() - start
+                });
+            } else if (error) {
+                outlet(0, "error", error);
+            }
+    }
+}
+
+// Run a single structural or messaging command.
+// Returns an error message, or null when the command succeeded.
+function run_command(data) {
+    switch (data.action) {
+        case "add_object":
+            if (data.obj_type && data.position && data.varname) {
+                return add_object(data.position[0], data.position[1], data.obj_type, data.args, data.varname);
+            }
+            return "Missing obj_type or position or varname for add_object";
+        case "remove_object":
+            if (data.varname) {
+                return remove_object(data.varname);
+            }
+            return "Missing varname for remove_object";
         case "connect_objects":
             if (data.src_varname && data.dst_varname) {
-                connect_objects(data.src_varname, data.outlet_idx || 0, data.dst_varname, data.inlet_idx || 0);
-            } else {
-                outlet(0, "error", "Missing src_varname or dst_varname for connect_objects");
+                return connect_objects(data.src_varname, data.outlet_idx || 0, data.dst_varname, data.inlet_idx || 0);
             }
-            break;
+            return "Missing src_varname or dst_varname for connect_objects";
         case "disconnect_objects":
             if (data.src_varname && data.dst_varname) {
-                disconnect_objects(data.src_varname, data.outlet_idx || 0, data.dst_varname, data.inlet_idx || 0);
-            } else {
-                outlet(0, "error", "Missing src_varname or dst_varname for disconnect_objects");
+                return disconnect_objects(data.src_varname, data.outlet_idx || 0, data.dst_varname, data.inlet_idx || 0);
             }
-            break;
+            return "Missing src_varname or dst_varname for disconnect_objects";
         case "set_object_attribute":
-            if (data.varname && data.attr_name && data.attr_value) {
-                set_object_attribute(data.varname, data.attr_name, data.attr_value);
-            } else {
-                outlet(0, "error", "Missing varname or attr_name for attr_value");
+            if (data.varname && data.attr_name && data.attr_value !== undefined && data.attr_value !== null) {
+                return set_object_attribute(data.varname, data.attr_name, data.attr_value);
             }
-            break;
+            return "Missing varname or attr_name for attr_value";
         case "set_message_text":
             if (data.varname && data.new_text) {
-                set_message_text(data.varname, data.new_text);
+                return set_message_text(data.varname, data.new_text);
             }
-            break;
+            return "Missing varname or new_text for set_message_text";
         case "send_message_to_object":
             if (data.varname && data.message) {
-                send_message_to_object(data.varname, data.message);
+                return send_message_to_object(data.varname, data.message);
             }
-            break;
+            return "Missing varname or message for send_message_to_object";
         case "send_bang_to_object":
             if (data.varname) {
-                send_bang_to_object(data.varname);
+                return send_bang_to_object(data.varname);
             }
-            break;
+            return "Missing varname for send_bang_to_object";
         case "set_number":
-            if (data.varname && data.num) {
-                set_number(data.varname, data.num);
+            if (data.varname && data.num !== undefined && data.num !== null) {
+                return set_number(data.varname, data.num);
             }
-            break;
+            return "Missing varname or num for set_number";
+        case "set_numbers":
+            if (data.values) {
+                return failures_error(set_numbers(data.values));
+            }
+            return "Missing values for set_numbers";
+        case "send_messages":
+            if (data.messages) {
+                return failures_error(send_messages(data.messages));
+            }
+            return "Missing messages for send_messages";
+        case "move_objects":
+            if (data.positions) {
+                return move_objects(data.positions);
+            }
+            return "Missing positions for move_objects";
         default:
-            outlet(0, "error", "Unknown action: " + data.action);
+            return "Unknown action: " + data.action;
     }
 }
 
+// Run a list of commands in order, within this single scheduler tick,
+// and report one result per operation.
+function apply_batch(request_id, operations) {
+    var results = [];
+    for (var i = 0; i < operations.length; i++) {
+        var error;
+        try {
+            error = run_command(operations[i]);
+        } catch (e) {
+            error = "Exception: " + e.message;
+        }
+        var result = {index: i, action: operations[i].action, success: !error};
+        if (error) {
+            result.error = error;
+        }
+        results.push(result);
+    }
+    send_response(request_id, results);
+}
+
+function send_response(request_id, results) {
+    var response = {"request_id": request_id, "results": results};
+    outlet(1, "response", split_long_string(JSON.stringify(response, null, 0), 2500));
+}
+
 // function fetch_test(request_id) {
 // 	var str = get_patcher_objects(request_id)
 // 	//outlet(1, request_id)
@@ -133,81 +235,93 @@ function anything() {
 
 function add_object(x, y, type, args, var_name) {
     var new_obj = p.newdefault(x, y, type, args);
+    if (!new_obj) {
+        return "Could not create object: " + type;
+    }
     new_obj.varname = var_name;
     if (type == "message" || type == "comment" || type == "flonum") {
         new_obj.message("set", args);
     }
+    return null;
 }
 
 function remove_object(var_name) {
 	var obj = p.getnamed(var_name);
-    if (obj) {
-	    p.remove(obj);
+    if (!obj) {
+        return "Object not found: " + var_name;
     }
+	p.remove(obj);
+    return null;
 }
 
 function connect_objects(src_varname, outlet_idx, dst_varname, inlet_idx) {
     var src = p.getnamed(src_varname);
     var dst = p.getnamed(dst_varname);
+    if (!src || !dst) {
+        return "Object not found: " + (src ? dst_varname : src_varname);
+    }
     p.connect(src, outlet_idx, dst, inlet_idx);
+    return null;
 }
 
 function disconnect_objects(src_varname, outlet_idx, dst_varname, inlet_idx) {
 	var src = p.getnamed(src_varname);
     var dst = p.getnamed(dst_varname);
+    if (!src || !dst) {
+        return "Object not found: " + (src ? dst_varname : src_varname);
+    }
 	p.disconnect(src, outlet_idx, dst, inlet_idx);
+    return null;
 }
 
 function set_object_attribute(varname, attr_name, attr_value) {
     var obj = p.getnamed(varname);
-    if (obj) {
-        if (obj.maxclass == "message" || obj.maxclass == "comment") {
-            if (attr_name == "text") {
-                obj.message("set", attr_value);
-            }
-        }
-        // Check if the attribute exists before setting it
-        var attrnames = obj.getattrnames();
-        if (attrnames.indexOf(attr_name) == -1) {
-            post("Attribute not found: " + attr_name);
-            return;
+    if (!obj) {
+        return "Object not found: " + varname;
+    }
+    if (obj.maxclass == "message" || obj.maxclass == "comment") {
+        if (attr_name == "text") {
+            obj.message("set", attr_value);
         }
-        // Set the attribute
-        obj.setattr(attr_name, attr_value);
-    } else {
-        post("Object not found: " + varname);
     }
+    // Check if the attribute exists before setting it
+    var attrnames = obj.getattrnames();
+    if (attrnames.indexOf(attr_name) == -1) {
+        return "Attribute not found: " + attr_name;
+    }
+    // Set the attribute
+    obj.setattr(attr_name, attr_value);
+    return null;
 }
 
 function set_message_text(varname, new_text) {
     var obj = p.getnamed(varname);
-    if (obj) {
-        if (obj.maxclass == "message") {
-            obj.message("set", new_text);
-        } else {
-            post("Object is not a message box: " + varname);
-        }
-    } else {
-        post("Object not found: " + varname);
+    if (!obj) {
+        return "Object not found: " + varname;
+    }
+    if (obj.maxclass != "message") {
+        return "Object is not a message box: " + varname;
     }
+    obj.message("set", new_text);
+    return null;
 }
 
 function send_message_to_object(varname, message) {
     var obj = p.getnamed(varname);
-    if (obj) {
-        obj.message(message);
-    } else {
-        post("Object not found: " + varname);
+    if (!obj) {
+        return "Object not found: " + varname;
     }
+    obj.message(message);
+    return null;
 }
 
 function send_bang_to_object(varname) {
     var obj = p.getnamed(varname);
-    if (obj) {
-        obj.message("bang");
-    } else {
-        post("Object not found: " + varname);
+    if (!obj) {
+        return "Object not found: " + varname;
     }
+    obj.message("bang");
+    return null;
 }
 
 function set_text_in_comment(varname, text) {
@@ -225,11 +339,73 @@ function set_text_in_comment(varname, text) {
 
 function set_number(varname, num) {
     var obj = p.getnamed(varname);
-    if (obj) {
-        obj.message("set", num);
-    } else {
-        post("Object not found: " + varname);
+    if (!obj) {
+        return "Object not found: " + varname;
     }
+    obj.message("set", num);
+    return null;
+}
+
+// Set many number boxes at once, in one pass; values maps varnames to numbers.
+// Returns the failures, as {varname, error}.
+function set_numbers(values) {
+    var failed = [];
+    for (var varname in values) {
+        var error = set_number(varname, values[varname]);
+        if (error) {
+            failed.push({varname: varname, error: error});
+        }
+    }
+    return failed;
+}
+
+// Send many messages in one pass; messages is a list of {varname, message}.
+// Returns the failures, as {varname, error}.
+function send_messages(messages) {
+    var failed = [];
+    for (var i = 0; i < messages.length; i++) {
+        var error;
+        if (!messages[i].varname || !messages[i].message) {
+            error = "Missing varname or message";
+        } else {
+            error = send_message_to_object(messages[i].varname, messages[i].message);
+        }
+        if (error) {
+            failed.push({varname: messages[i].varname, error: error});
+        }
+    }
+    return failed;
+}
+
+function failures_error(failed) {
+    if (failed.length == 0) {
+        return null;
+    }
+    var errors = [];
+    for (var i = 0; i < failed.length; i++) {
+        errors.push(failed[i].error);
+    }
+    return errors.join("; ");
+}
+
+// Move many boxes at once; positions maps varnames to new [x, y], sizes are kept.
+function move_objects(positions) {
+    var missing = [];
+    for (var varname in positions) {
+        var obj = p.getnamed(varname);
+        if (!obj) {
+            missing.push(varname);
+            continue;
+        }
+        var rect = obj.rect;
+        var x = positions[varname][0];
+        var y = positions[varname][1];
+        obj.rect = [x, y, x + rect[2] - rect[0], y + rect[3] - rect[1]];
+    }
+    if (missing.length > 0) {
+        return "Objects not found: " + missing.join(", ");
+    }
+    return null;
 }
 
 // ========================================
@@ -237,15 +413,11 @@ function set_number(varname, num) {
 
 function get_objects_in_patch(request_id) {
     
-	var p = this.patcher
-    obj_count = 0;
-    boxes = [];
-    lines = [];
-
-    p.applydeep(collect_objects);
+    scan_changes(request_id);
     var patcher_dict = {};
     patcher_dict["boxes"] = boxes;
     patcher_dict["lines"] = lines;
+    patcher_dict["version"] = patch_version;
 
     // use these if no v8:
     // var results = {"request_id": request_id, "results": patcher_dict}
@@ -277,6 +449,131 @@ function get_objects_in_selected(request_id) {
     outlet(2, "add_boxtext", request_id, JSON.stringify(patcher_dict, null, 0));
 }
 
+// Return one page of the patch. The first page (no cursor) takes a snapshot; the
+// following pages are read from that same snapshot through the returned
+// next_cursor, "<version>:<offset>", until a newer snapshot replaces it.
+// Each page holds the patch cords going out of its boxes.
+function get_objects_page(request_id, cursor, limit) {
+    var offset = 0;
+    if (cursor) {
+        var parts = String(cursor).split(":");
+        if (!paged_snapshot || parseInt(parts[0]) != paged_snapshot.version) {
+            send_response(request_id, {error: "Cursor expired, start again without cursor", expired: true});
+            return;
+        }
+        offset = parseInt(parts[1]);
+    } else {
+        scan_changes(request_id);
+        var lines_by_source = {};
+        for (var i = 0; i < lines.length; i++) {
+            var source = lines[i].patchline.source[0];
+            (lines_by_source[source] = lines_by_source[source] || []).push(lines[i]);
+        }
+        paged_snapshot = {version: patch_version, boxes: boxes, lines_by_source: lines_by_source};
+    }
+
+    var page_boxes = paged_snapshot.boxes.slice(offset, offset + limit);
+    var page_lines = [];
+    for (var i = 0; i < page_boxes.length; i++) {
+        page_lines = page_lines.concat(paged_snapshot.lines_by_source[page_boxes[i].box.varname] || []);
+    }
+    var end = offset + page_boxes.length;
+    var patcher_dict = {
+        boxes: page_boxes,
+        lines: page_lines,
+        version: paged_snapshot.version,
+        total: paged_snapshot.boxes.length,
+        next_cursor: end < paged_snapshot.boxes.length ? paged_snapshot.version + ":" + end : null
+    };
+    outlet(2, "add_boxtext", request_id, JSON.stringify(patcher_dict, null, 0));
+}
+
+// Return the changes after since_version, or the whole patch (with "full": true)
+// when they are no longer all in the change log.
+function get_patch_changes(request_id, since_version) {
+    scan_changes(request_id);
+    var oldest = change_log.length ? change_log[0].version : patch_version + 1;
+    if (since_version < oldest - 1 || since_version > patch_version) {
+        var patcher_dict = {boxes: boxes, lines: lines, version: patch_version, full: true};
+        outlet(2, "add_boxtext", request_id, JSON.stringify(patcher_dict, null, 0));
+        return;
+    }
+    var changes = [];
+    for (var i = change_log.length - 1; i >= 0 && change_log[i].version > since_version; i--) {
+        changes.unshift(change_log[i]);
+    }
+    var delta = {changes: changes, version: patch_version, full: false};
+    outlet(2, "add_changes_boxtext", request_id, JSON.stringify(delta, null, 0));
+}
+
+// Walk the patch and log what changed since the last walk, bumping patch_version
+// once per change. Leaves the current boxes and lines in the globals.
+function scan_changes(request_id) {
+    var p = this.patcher
+    obj_count = 0;
+    boxes = [];
+    lines = [];
+    progress_request_id = request_id;
+    p.applydeep(collect_objects);
+    progress_request_id = null;
+    if (request_id && obj_count >= PROGRESS_INTERVAL) {
+        // serializing a large patch takes a while too
+        outlet(1, "progress", request_id, obj_count);
+    }
+    // mark the boxes inside subpatchers, which commands cannot reach by varname
+    var top_level = {};
+    p.apply(function (obj) {
+        top_level[obj.varname] = true;
+    });
+
+    var current_boxes = {};
+    for (var i = 0; i < boxes.length; i++) {
+        var box = boxes[i].box;
+        if (!top_level[box.varname]) {
+            box.nested = true;
+        }
+        var old = known_boxes[box.varname];
+        current_boxes[box.varname] = box;
+        if (!old) {
+            record_change({type: "box_added", box: box});
+        } else if (String(old.patching_rect) != String(box.patching_rect)) {
+            record_change({type: "box_moved", varname: box.varname, patching_rect: box.patching_rect});
+        }
+    }
+    for (var varname in known_boxes) {
+        if (!current_boxes[varname]) {
+            record_change({type: "box_removed", varname: varname});
+        }
+    }
+
+    var current_lines = {};
+    for (var i = 0; i < lines.length; i++) {
+        var line = lines[i].patchline;
+        var key = line.source + ">" + line.destination;
+        current_lines[key] = line;
+        if (!known_lines[key]) {
+            record_change({type: "line_added", patchline: line});
+        }
+    }
+    for (var key in known_lines) {
+        if (!current_lines[key]) {
+            record_change({type: "line_removed", patchline: known_lines[key]});
+        }
+    }
+
+    known_boxes = current_boxes;
+    known_lines = current_lines;
+}
+
+function record_change(change) {
+    patch_version += 1;
+    change.version = patch_version;
+    change_log.push(change);
+    if (change_log.length > CHANGE_LOG_SIZE) {
+        change_log.shift();
+    }
+}
+
 function collect_objects(obj) {
     //var keys = Object.keys(obj.varname);
     //post(typeof obj.varname + "\n");
@@ -287,6 +584,9 @@ function collect_objects(obj) {
         obj.varname = "obj-" + obj_count;
     }
     obj_count+=1;
+    if (progress_request_id && obj_count % PROGRESS_INTERVAL == 0) {
+        outlet(1, "progress", progress_request_id, obj_count);
+    }
 
     var outputs = obj.patchcords.outputs;
     if (outputs.length){
@@ -2,17 +2,23 @@ autowatch = 1;
 
 const Max = require("max-api");
 const { Server } = require("socket.io");
+const zlib = require("zlib");
+
+// MessagePack is optional: without it every client gets plain JSON responses
+var msgpack_encode = null;
+try {
+  msgpack_encode = require("@msgpack/msgpack").encode;
+} catch (e) {
+  Max.post("@msgpack/msgpack not installed, responses are sent as JSON");
+}
 
 // Configuration
 var PORT = 5002;
 const NAMESPACE = "/mcp";
+// Packed responses larger than this many bytes are zlib-compressed
+const COMPRESS_THRESHOLD = 8192;
 
-// Create Socket.IO server
-var io = new Server(PORT, {
-  cors: { origin: "*" }
-});
-
-Max.outlet("port", `Server listening on port ${PORT}`);
+var io = null;
 
 function safe_parse_json(str) {
     try {
@@ -24,53 +30,89 @@ function safe_parse_json(str) {
     }
 }
 
-Max.addHandler("response", async (...msg) => {
-	var str = msg.join("")
-	var data = safe_parse_json(str);
-	await io.of(NAMESPACE).emit("response", data);
-	// await Max.post(`Sent response: ${JSON.stringify(data)}`);
-});
+// Frame: one flag byte (0 = msgpack, 1 = zlib-compressed msgpack) followed by the body
+function pack(data, compress) {
+  var body = Buffer.from(msgpack_encode(data));
+  if (compress && body.length > COMPRESS_THRESHOLD) {
+    return Buffer.concat([Buffer.from([1]), zlib.deflateSync(body)]);
+  }
+  return Buffer.concat([Buffer.from([0]), body]);
+}
+
+function emit_response(data) {
+  var packed = {};
+  for (const socket of io.of(NAMESPACE).sockets.values()) {
+    var encoding = socket.data.encoding;
+    if (encoding == "json") {
+      socket.emit("response", data);
+    } else {
+      // encode once per encoding, not once per client
+      packed[encoding] = packed[encoding] || pack(data, encoding == "msgpack+zlib");
+      socket.emit("packed_response", packed[encoding]);
+    }
+  }
+}
 
-Max.addHandler("port", async (msg) => {
-  Max.post(`msg ${msg}`);
-  if (msg > 0 && msg < 65536) {
-    PORT = msg;
+// Pick the most compact encoding offered by the client in its handshake
+function negotiate_encoding(socket) {
+  var offered = (socket.handshake.auth && socket.handshake.auth.encodings) || [];
+  if (!msgpack_encode || offered.indexOf("msgpack") == -1) {
+    return "json";
+  }
+  return offered.indexOf("zlib") == -1 ? "msgpack" : "msgpack+zlib";
+}
+
+async function restart_server(port) {
+  Max.post(`msg ${port}`);
+  if (port > 0 && port < 65536) {
+    PORT = port;
   }
   await io.close();
+  start_server();
+  // await Max.post(`Socket.IO MCP server listening on port ${PORT}`);
+  await Max.outlet("port", `Server listening on port ${PORT}`);
+}
+
+function start_server() {
+  // Create Socket.IO server
   io = new Server(PORT, {
     cors: { origin: "*" }
   });
-  // await Max.post(`Socket.IO MCP server listening on port ${PORT}`);
-  await Max.outlet("port", `Server listening on port ${PORT}`);
-});
 
-io.of(NAMESPACE).on("connection", (socket) => {
-  Max.post(`Socket.IO client connected: ${socket.id}`);
+  io.of(NAMESPACE).on("connection", (socket) => {
+    socket.data.encoding = negotiate_encoding(socket);
+    Max.post(`Socket.IO client connected: ${socket.id} (${socket.data.encoding})`);
 
-  socket.on("command", async (data) => {
-    // Max.post(`Socket.IO command received: ${data}`);
-	  Max.outlet("command", JSON.stringify(data)); 
-  });
+    socket.on("command", async (data) => {
+      // Max.post(`Socket.IO command received: ${data}`);
+      Max.outlet("command", JSON.stringify(data));
+    });
 
-  socket.on("request", async (data) => {
-	  Max.outlet("request", JSON.stringify(data)); 
-  });
+    socket.on("request", async (data) => {
+      Max.outlet("request", JSON.stringify(data));
+    });
 
-  socket.on("port", async (data) => {
-    Max.post(`msg ${data}`);
-    if (data > 0 && data < 65536) {
-      PORT = data;
-    }
-    await io.close();
-    io = new Server(PORT, {
-      cors: { origin: "*" }
+    socket.on("port", restart_server);
+
+    socket.on("disconnect", () => {
+      Max.post(`Socket.IO client disconnected: ${socket.id}`);
     });
-    // await Max.post(`Socket.IO MCP server listening on port ${PORT}`);
-    await Max.outlet("port", `Server listening on port ${PORT}`);
   });
-  
+}
 
-  socket.on("disconnect", () => {
-    Max.post(`Socket.IO client disconnected: ${socket.id}`);
-  });
+start_server();
+Max.outlet("port", `Server listening on port ${PORT}`);
+
+Max.addHandler("response", async (...msg) => {
+	var str = msg.join("")
+	var data = safe_parse_json(str);
+	emit_response(data);
+	// await Max.post(`Sent response: ${JSON.stringify(data)}`);
 });
+
+// Keep-alive for long requests: how many boxes Max has collected so far
+Max.addHandler("progress", async (request_id, progress) => {
+	io.of(NAMESPACE).emit("progress", { request_id: request_id, progress: progress });
+});
+
+Max.addHandler("port", restart_server);
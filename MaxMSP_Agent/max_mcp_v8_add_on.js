@@ -32,14 +32,28 @@ function anything() {
             }
             add_boxtext(arguments[0], arguments[1]);
             break;
+        case "add_changes_boxtext":
+            if (arguments.length < 2) {
+                post("add_changes_boxtext: need two args: request_id, stringified_changes \n");
+                return;
+            }
+            add_changes_boxtext(arguments[0], arguments[1]);
+            break;
         default:
             // outlet(1, messagename, ...arguments);
             outlet(1, "response", arguments[1]);
     }
 }
 
+// Keep-alive for the server while a large patch is parsed, read and serialized
+// here, which can take longer than its request timeout.
+function keep_alive(request_id, stage) {
+    outlet(1, "progress", request_id, stage);
+}
+
 function add_boxtext(request_id, data){
     // post(patcher_dict + "\n");
+    keep_alive(request_id, "parsing");
     var patcher_dict = safe_parse_json(data);
     var p = this.patcher;
 
@@ -50,8 +64,29 @@ function add_boxtext(request_id, data){
         }
     });
 
+    keep_alive(request_id, "serializing");
     var results = {"request_id": request_id, "results": patcher_dict}
     outlet(1, "response", split_long_string(JSON.stringify(results, null, 0), 2500));
 }
 
+function add_changes_boxtext(request_id, data){
+    keep_alive(request_id, "parsing");
+    var delta = safe_parse_json(data);
+    var p = this.patcher;
+
+    delta.changes.forEach(function (c) {
+        if (c.type != "box_added") {
+            return;
+        }
+        var obj = p.getnamed(c.box.varname);
+        if (obj) {
+            c.box["text"] = obj.boxtext;
+        }
+    });
+
+    keep_alive(request_id, "serializing");
+    var results = {"request_id": request_id, "results": delta}
+    outlet(1, "response", split_long_string(JSON.stringify(results, null, 0), 2500));
+}
+
 
@@ -0,0 +1,4 @@
+"""Benchmarks of the MCP server against a stand-in for Max.
+
+Run them with `python -m benchmarks.run`; see the README.
+"""
@@ -0,0 +1,297 @@
+# fake_max.py
+"""Stand-in for Max: a Socket.IO server speaking like max_mcp_node.js, running
+the max_mcp.js actions on an in-memory patch."""
+import asyncio
+import time
+import zlib
+
+import socketio
+from aiohttp import web
+
+try:
+    import msgpack
+except ImportError:  # fall back to JSON responses, as max_mcp_node.js does
+    msgpack = None
+
+NAMESPACE = "/mcp"
+CHANGE_LOG_SIZE = 2000  # as in max_mcp.js
+PROGRESS_INTERVAL = 500
+COMPRESS_THRESHOLD = 8192  # as in max_mcp_node.js
+
+
+class FakePatch:
+    """The boxes and patch cords of a patch, with the change log of max_mcp.js."""
+
+    def __init__(self):
+        self.boxes = {}  # varname -> box, as sent by max_mcp.js
+        self.lines = {}  # (src, outlet, dst, inlet) -> None, in insertion order
+        self.attributes = {}  # varname -> attributes
+        self.selected = set()
+        self.version = 0
+        self.change_log = []
+        self.paged_snapshot = None
+
+    def seed(self, size: int, columns: int = 20):
+        """Fill the patch with size boxes in a grid, each connected to the next."""
+        for i in range(size):
+            x, y = 20 + 80 * (i % columns), 20 + 40 * (i // columns)
+            self.run_command(
+                {"action": "add_object", "obj_type": "cycle~" if i % 2 else "*~",
+                 "position": [x, y], "args": [i], "varname": f"obj-{i}"}
+            )
+            if i:
+                self.run_command(
+                    {"action": "connect_objects", "src_varname": f"obj-{i - 1}",
+                     "outlet_idx": 0, "dst_varname": f"obj-{i}", "inlet_idx": 0}
+                )
+
+    def _record(self, change: dict):
+        self.version += 1
+        change["version"] = self.version
+        self.change_log.append(change)
+        if len(self.change_log) > CHANGE_LOG_SIZE:
+            del self.change_log[0]
+
+    def run_command(self, data: dict) -> str:
+        """Run a command; the error message of max_mcp.js, or None."""
+        action = data.get("action")
+        varname = data.get("varname")
+        if action == "add_object":
+            if not (data.get("obj_type") and data.get("position") and varname):
+                return "Missing obj_type or position or varname for add_object"
+            x, y = data["position"]
+            text = " ".join(str(a) for a in [data["obj_type"], *(data.get("args") or [])])
+            box = {"maxclass": data["obj_type"], "varname": varname,
+                   "patching_rect": [x, y, x + 50, y + 22], "text": text}
+            self.boxes[varname] = box
+            self.attributes[varname] = {"patching_rect": box["patching_rect"]}
+            self._record({"type": "box_added", "box": box})
+        elif action == "remove_object":
+            if varname not in self.boxes:
+                return "Object not found: " + str(varname)
+            del self.boxes[varname]
+            self.attributes.pop(varname, None)
+            self._record({"type": "box_removed", "varname": varname})
+            for line in [l for l in self.lines if varname in (l[0], l[2])]:
+                del self.lines[line]
+                self._record({"type": "line_removed", "patchline": _patchline(line)["patchline"]})
+        elif action in ("connect_objects", "disconnect_objects"):
+            src, dst = data.get("src_varname"), data.get("dst_varname")
+            if src not in self.boxes or dst not in self.boxes:
+                return "Object not found: " + str(dst if src in self.boxes else src)
+            line = (src, data.get("outlet_idx") or 0, dst, data.get("inlet_idx") or 0)
+            if action == "connect_objects" and line not in self.lines:
+                self.lines[line] = None
+                self._record({"type": "line_added", "patchline": _patchline(line)["patchline"]})
+            elif action == "disconnect_objects" and line in self.lines:
+                del self.lines[line]
+                self._record({"type": "line_removed", "patchline": _patchline(line)["patchline"]})
+        elif action == "set_object_attribute":
+            if varname not in self.boxes:
+                return "Object not found: " + str(varname)
+            if data["attr_name"] == "patching_rect":
+                x, y, w, h = data["attr_value"]
+                self._move(varname, [x, y, x + w, y + h])
+            self.attributes[varname][data["attr_name"]] = data["attr_value"]
+        elif action == "move_objects":
+            missing = [v for v in data["positions"] if v not in self.boxes]
+            for v, (x, y) in data["positions"].items():
+                if v in self.boxes:
+                    left, top, right, bottom = self.boxes[v]["patching_rect"]
+                    self._move(v, [x, y, x + right - left, y + bottom - top])
+            if missing:
+                return "Objects not found: " + ", ".join(missing)
+        elif action in ("set_numbers", "send_messages"):
+            failed = self.failed_targets(data)
+            if failed:
+                return "; ".join(f["error"] for f in failed)
+        elif action in ("set_message_text", "send_message_to_object",
+                        "send_bang_to_object", "set_number"):
+            if varname not in self.boxes:
+                return "Object not found: " + str(varname)
+        else:
+            return "Unknown action: " + str(action)
+        return None
+
+    def failed_targets(self, data: dict) -> list:
+        """The {varname, error} failures of a set_numbers or send_messages command."""
+        if data["action"] == "set_numbers":
+            varnames = list(data["values"])
+        else:
+            varnames = [m.get("varname") for m in data["messages"]]
+        return [{"varname": v, "error": "Object not found: " + str(v)}
+                for v in varnames if v not in self.boxes]
+
+    def _move(self, varname: str, rect: list):
+        self.boxes[varname] = {**self.boxes[varname], "patching_rect": rect}
+        self._record({"type": "box_moved", "varname": varname, "patching_rect": rect})
+
+    def snapshot(self, selected_only: bool = False) -> dict:
+        boxes = [{"box": b} for v, b in self.boxes.items()
+                 if not selected_only or v in self.selected]
+        lines = [_patchline(l) for l in self.lines
+                 if not selected_only or l[0] in self.selected]
+        return {"boxes": boxes, "lines": lines, "version": self.version}
+
+    def page(self, cursor: str, limit: int) -> dict:
+        offset = 0
+        if cursor:
+            version, offset = (int(part) for part in str(cursor).split(":"))
+            if not self.paged_snapshot or version != self.paged_snapshot["version"]:
+                return {"error": "Cursor expired, start again without cursor", "expired": True}
+        else:
+            self.paged_snapshot = self.snapshot()
+        boxes = self.paged_snapshot["boxes"][offset : offset + limit]
+        sources = {b["box"]["varname"] for b in boxes}
+        end = offset + len(boxes)
+        total = len(self.paged_snapshot["boxes"])
+        return {
+            "boxes": boxes,
+            "lines": [l for l in self.paged_snapshot["lines"]
+                      if l["patchline"]["source"][0] in sources],
+            "version": self.paged_snapshot["version"],
+            "total": total,
+            "next_cursor": f"{self.paged_snapshot['version']}:{end}" if end < total else None,
+        }
+
+    def changes(self, since_version: int) -> dict:
+        oldest = self.change_log[0]["version"] if self.change_log else self.version + 1
+        if since_version < oldest - 1 or since_version > self.version:
+            return {**self.snapshot(), "full": True}
+        changes = [c for c in self.change_log if c["version"] > since_version]
+        return {"changes": changes, "version": self.version, "full": False}
+
+    def avoid_rect(self) -> list:
+        rects = [b["patching_rect"] for v, b in self.boxes.items() if v.startswith("maxmcpid")]
+        if not rects:
+            return [None, None, None, None]
+        return [min(r[0] for r in rects), min(r[1] for r in rects),
+                max(r[2] for r in rects), max(r[3] for r in rects)]
+
+
+def _patchline(line: tuple) -> dict:
+    src, outlet, dst, inlet = line
+    return {"patchline": {"source": [src, outlet], "destination": [dst, inlet]}}
+
+
+class FakeMax:
+    """Socket.IO server answering commands and requests the way Max does.
+
+    Max handles one message at a time; `delay` adds a fixed time per message, to
+    emulate the scheduler and the js object, and `op_delay` a time per operation
+    of apply_batch.
+    """
+
+    def __init__(
+        self, port: int = 5002, patch: FakePatch = None, delay: float = 0.0, op_delay: float = 0.0
+    ):
+        self.port = port
+        self.patch = patch or FakePatch()
+        self.delay = delay
+        self.op_delay = op_delay
+        self.messages = 0
+        self.sio = socketio.AsyncServer(async_mode="aiohttp")
+        self.app = web.Application()
+        self.sio.attach(self.app)
+        self.encodings = {}  # sid -> negotiated encoding
+        self._max_thread = asyncio.Lock()
+        self._runner = None
+        self.sio.on("connect", self._on_connect, namespace=NAMESPACE)
+        self.sio.on("disconnect", self._on_disconnect, namespace=NAMESPACE)
+        self.sio.on("command", self._on_message, namespace=NAMESPACE)
+        self.sio.on("request", self._on_message, namespace=NAMESPACE)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _on_connect(self, sid, environ, auth=None):
+        offered = (auth or {}).get("encodings") or []
+        if msgpack is None or "msgpack" not in offered:
+            self.encodings[sid] = "json"
+        else:
+            self.encodings[sid] = "msgpack+zlib" if "zlib" in offered else "msgpack"
+
+    async def _on_disconnect(self, sid, *args):
+        self.encodings.pop(sid, None)
+
+    async def _on_message(self, sid, data):
+        async with self._max_thread:
+            self.messages += 1
+            delay = self.delay
+            if data.get("action") == "apply_batch":
+                delay += self.op_delay * len(data["operations"])
+            if delay:
+                await asyncio.sleep(delay)
+            await self._handle(data)
+
+    async def _handle(self, data: dict):
+        action = data.get("action")
+        request_id = data.get("request_id")
+        patch = self.patch
+        if action in ("get_objects_in_patch", "get_objects_in_selected", "get_patch_changes"):
+            if len(patch.boxes) >= PROGRESS_INTERVAL:
+                await self._emit("progress", {"request_id": request_id, "progress": len(patch.boxes)})
+        if action == "get_objects_in_patch":
+            if data.get("limit") or data.get("cursor"):
+                results = patch.page(data.get("cursor"), data.get("limit") or 500)
+            else:
+                results = patch.snapshot()
+        elif action == "get_objects_in_selected":
+            results = patch.snapshot(selected_only=True)
+        elif action == "get_object_attributes":
+            if data.get("varname") not in patch.attributes:
+                return  # max_mcp.js only posts an error
+            results = patch.attributes[data["varname"]]
+        elif action == "get_patch_changes":
+            results = patch.changes(data.get("since_version") or 0)
+        elif action == "get_avoid_rect_position":
+            results = patch.avoid_rect()
+        elif action == "apply_batch":
+            results = []
+            for i, op in enumerate(data["operations"]):
+                error = patch.run_command(op)
+                result = {"index": i, "action": op.get("action"), "success": not error}
+                if error:
+                    result["error"] = error
+                results.append(result)
+        elif action in ("set_numbers", "send_messages"):
+            failed = patch.failed_targets(data)
+            if not request_id:
+                return
+            results = {"success": not failed, "error": "; ".join(f["error"] for f in failed) or None,
+                       "failed": failed, "elapsed_ms": 0}
+        else:
+            start = time.perf_counter()
+            error = patch.run_command(data)
+            if not request_id:
+                return
+            elapsed_ms = round((time.perf_counter() - start) * 1000)
+            results = {"success": not error, "error": error, "elapsed_ms": elapsed_ms}
+        await self._respond({"request_id": request_id, "results": results})
+
+    async def _emit(self, event: str, data):
+        await self.sio.emit(event, data, namespace=NAMESPACE)
+
+    async def _respond(self, data: dict):
+        # like emit_response in max_mcp_node.js: encode once per encoding
+        packed = {}
+        for sid, encoding in list(self.encodings.items()):
+            if encoding == "json":
+                await self.sio.emit("response", data, to=sid, namespace=NAMESPACE)
+                continue
+            if encoding not in packed:
+                packed[encoding] = _pack(data, encoding == "msgpack+zlib")
+            await self.sio.emit("packed_response", packed[encoding], to=sid, namespace=NAMESPACE)
+
+
+def _pack(data: dict, compress: bool) -> bytes:
+    body = msgpack.packb(data)
+    if compress and len(body) > COMPRESS_THRESHOLD:
+        return b"\x01" + zlib.compress(body)
+    return b"\x00" + body
@@ -0,0 +1,294 @@
+# run.py
+"""Run the benchmark scenarios against FakeMax and write the results as JSON.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json   # fail on regressions
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import server
+from benchmarks.fake_max import FakeMax, FakePatch
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    """Throughput and latency percentiles of operations timed individually."""
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round(len(ordered) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+async def timed(calls) -> dict:
+    """Run awaitables one after the other, timing each."""
+    latencies = []
+    start = time.perf_counter()
+    for call in calls:
+        t = time.perf_counter()
+        await call
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def timed_concurrently(calls) -> dict:
+    """Run awaitables all at once, timing each."""
+
+    async def one(call):
+        t = time.perf_counter()
+        await call
+        return time.perf_counter() - t
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(call) for call in calls))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def chain(size: int, prefix: str):
+    objects = [
+        {"ref": f"{prefix}{i}", "obj_type": "cycle~", "position": [20 + 80 * (i % 20), 20 + 40 * (i // 20)], "args": [440]}
+        for i in range(size)
+    ]
+    connections = [
+        {"src": f"{prefix}{i}", "outlet_idx": 0, "dst": f"{prefix}{i + 1}", "inlet_idx": 0}
+        for i in range(size - 1)
+    ]
+    return objects, connections
+
+
+async def bulk_add_connect(conn, fake, size):
+    """Build a chain of `size` objects, as one batch and as acknowledged commands."""
+    await conn.get_patch("strong")
+    objects, connections = chain(size, "batch")
+    batch = server.compile_subgraph(objects, connections, [])
+    results = {"apply_batch": await timed([conn.apply_batch(batch)])}
+
+    objects, connections = chain(size, "single")
+    commands = server.compile_subgraph(objects, connections, [])
+    start = time.perf_counter()
+    latencies = []
+
+    async def one(cmd):
+        t = time.perf_counter()
+        await conn.send_command(cmd, ack=True)
+        latencies.append(time.perf_counter() - t)
+
+    # objects must exist before they are connected
+    adds = [c for c in commands if c["action"] == "add_object"]
+    connects = [c for c in commands if c["action"] != "add_object"]
+    await asyncio.gather(*(one(c) for c in adds))
+    await asyncio.gather(*(one(c) for c in connects))
+    results["acked_commands"] = summarize(latencies, time.perf_counter() - start)
+    return results
+
+
+async def snapshot(conn, fake, size, repeat=20, page_size=500):
+    """Read a patch of `size` boxes from Max, whole and in pages, and from the mirror."""
+    fake.patch = FakePatch()
+    fake.patch.seed(size)
+    results = {"strong": await timed(conn.get_patch("strong") for _ in range(repeat))}
+    results["mirror"] = await timed(conn.get_patch() for _ in range(repeat))
+
+    async def all_pages():
+        page = await conn.get_patch_page(None, page_size)
+        while page["next_cursor"]:
+            page = await conn.get_patch_page(page["next_cursor"], page_size)
+
+    results["paged"] = await timed(all_pages() for _ in range(max(1, repeat // 4)))
+    fake.patch.run_command(
+        {"action": "set_object_attribute", "varname": "obj-0", "attr_name": "patching_rect", "attr_value": [0, 0, 50, 22]}
+    )
+    results["changes"] = await timed(
+        conn.get_patch_changes(conn.mirror.max_version) for _ in range(repeat)
+    )
+    return results
+
+
+async def request_storm(conn, fake, size, concurrency=200):
+    """Many different reads in flight at once, then identical ones (coalesced)."""
+    fake.patch = FakePatch()
+    fake.patch.seed(size)
+    varnames = list(fake.patch.boxes)
+    distinct = await timed_concurrently(
+        conn.get_attributes(random.choice(varnames), "strong") for _ in range(concurrency)
+    )
+    identical = await timed_concurrently(
+        conn.send_request({"action": "get_avoid_rect_position"}) for _ in range(concurrency)
+    )
+    return {"distinct": distinct, "identical": identical, "messages_to_max": fake.messages}
+
+
+async def doc_lookups(conn, fake, size, repeat=1000):
+    """Lookups in the object documentation, in process."""
+    index = server.docs_index
+    names = list(index.names())
+    queries = ["oscillator", "audio output", "delay", "filter", "metro"]
+
+    def run(fn, args):
+        latencies = []
+        start = time.perf_counter()
+        for i in range(repeat):
+            t = time.perf_counter()
+            fn(args[i % len(args)])
+            latencies.append(time.perf_counter() - t)
+        return summarize(latencies, time.perf_counter() - start)
+
+    typos = [name[1:] + name[0] if len(name) > 1 else name + "x" for name in names]
+    return {
+        "get_object_doc": run(lambda n: server.get_object_doc(None, n), names),
+        "signature": run(lambda n: server.get_object_doc(None, n, view="signature"), names),
+        "search": run(index.search, queries),
+        # the suggestions of each misspelling are cached after the first round
+        "suggest": run(index.suggest, typos),
+    }
+
+
+async def live_control(conn, fake, size, op_delay=0.0001, interval=0.005):
+    """Acknowledged set_number calls while large batches are applied, as when a
+    patch is rebuilt during a performance."""
+    await conn.get_patch("strong")
+    fake.patch.run_command(
+        {"action": "add_object", "obj_type": "number", "position": [0, 0], "varname": "live", "args": []}
+    )
+    fake.op_delay = op_delay
+    try:
+        batches = [
+            conn.apply_batch(server.compile_subgraph(*chain(size, f"live{b}_"), []))
+            for b in range(4)
+        ]
+        building = asyncio.ensure_future(asyncio.gather(*batches))
+        latencies = []
+        start = time.perf_counter()
+        while not building.done():
+            t = time.perf_counter()
+            await conn.send_command({"action": "set_number", "varname": "live", "num": 1}, ack=True)
+            latencies.append(time.perf_counter() - t)
+            await asyncio.sleep(interval)
+        await building
+    finally:
+        fake.op_delay = 0.0
+    return {
+        "set_number": summarize(latencies, time.perf_counter() - start),
+        "batches_s": round(time.perf_counter() - start, 3),
+    }
+
+
+SCENARIOS = {
+    "bulk_add_connect": bulk_add_connect,
+    "snapshot": snapshot,
+    "request_storm": request_storm,
+    "doc_lookups": doc_lookups,
+    "live_control": live_control,
+}
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(scenarios: list, size: int, port: int, delay: float) -> dict:
+    fake = FakeMax(port, delay=delay)
+    await fake.start()
+    conn = server.MaxMSPConnection("http://127.0.0.1", port, server.NAMESPACE)
+    await conn.start_server()
+    await asyncio.wait_for(conn._connected.wait(), 5)
+    results = {}
+    try:
+        for name in scenarios:
+            fake.messages = 0
+            print(f"Running {name}", file=sys.stderr)
+            results[name] = await SCENARIOS[name](conn, fake, size)
+    finally:
+        await conn.close()
+        await fake.stop()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "size": size,
+        "delay": delay,
+        "scenarios": results,
+    }
+
+
+def regressions(
+    results: dict, baseline: dict, tolerance: float, min_delta_ms: float = 0.1
+) -> list:
+    """Latencies more than `tolerance` (a fraction) above the baseline's, ignoring
+    differences under min_delta_ms, which are noise."""
+    found = []
+
+    def walk(new, old, path):
+        for key, value in new.items():
+            if key not in old:
+                continue
+            if isinstance(value, dict):
+                walk(value, old[key], f"{path}.{key}")
+            elif (
+                key.endswith("_ms")
+                and value > old[key] * (1 + tolerance)
+                and value - old[key] > min_delta_ms
+            ):
+                found.append(f"{path}.{key}: {old[key]} -> {value}")
+
+    walk(results["scenarios"], baseline["scenarios"], "scenarios")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="Scenario to run; repeat for several. Defaults to all.")
+    parser.add_argument("--size", type=int, default=2000, help="Number of boxes in the patch.")
+    parser.add_argument("--port", type=int, default=5102)
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="Seconds FakeMax spends on each message.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with the results in this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed latency increase over the baseline, as a fraction.")
+    args = parser.parse_args()
+
+    # connections and the HTTP requests of FakeMax are logged at INFO
+    logging.getLogger().setLevel(logging.WARNING)
+    results = asyncio.run(run(args.scenario or list(SCENARIOS), args.size, args.port, args.delay))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"Regression: {line}", file=sys.stderr)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
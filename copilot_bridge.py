@@ -14,7 +14,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 try:
-    from server import MaxMSPConnection, mcp, docs, flattened_docs
+    from server import MaxMSPConnection, mcp, flattened_docs, docs_index
     print("✅ Servidor MCP importado com sucesso", file=sys.stderr)
 except ImportError as e:
     print(f"❌ Erro ao importar servidor MCP: {e}", file=sys.stderr)
@@ -85,13 +85,10 @@ class CopilotMCPBridge:
         """Fornece ajuda geral sobre MaxMSP"""
         # Buscar na documentação
         relevant_docs = []
-        query_lower = query.lower()
         
-        for obj_name, obj_info in flattened_docs.items():
-            if query_lower in obj_name.lower() or query_lower in obj_info.get("description", "").lower():
-                relevant_docs.append(f"**{obj_name}**: {obj_info.get('description', 'Sem descrição')}")
-                if len(relevant_docs) >= 5:  # Limitar a 5 resultados
-                    break
+        for hit in docs_index.search(query, limit=5):  # Os 5 mais relevantes
+            obj_info = flattened_docs[hit["name"]]
+            relevant_docs.append(f"**{hit['name']}**: {obj_info.get('description', 'Sem descrição')}")
         
         if relevant_docs:
             docs_text = "\n".join(relevant_docs)
@@ -35,7 +35,7 @@ logger = logging.getLogger(__name__)
 sys.path.insert(0, str(Path(__file__).parent))
 
 try:
-    from server import MaxMSPConnection, docs, flattened_docs
+    from server import MaxMSPConnection, flattened_docs, docs_index
     logger.info("✅ Servidor MCP importado com sucesso")
 except ImportError as e:
     logger.error(f"❌ Erro ao importar servidor MCP: {e}")
@@ -186,14 +186,10 @@ class MaxMSPCopilotBridge:
         else:
             # Busca aproximada
             similar_objects = []
-            search_term = object_name.lower()
             
-            for obj_name, obj_info in flattened_docs.items():
-                if (search_term in obj_name.lower() or 
-                    search_term in obj_info.get('description', '').lower()):
-                    similar_objects.append((obj_name, obj_info.get('description', obj_info.get('digest', 'Sem descrição'))))
-                    if len(similar_objects) >= 5:
-                        break
+            for hit in docs_index.search(object_name, limit=5):
+                obj_info = flattened_docs[hit["name"]]
+                similar_objects.append((hit["name"], obj_info.get('description', obj_info.get('digest', 'Sem descrição'))))
             
             if similar_objects:
                 result = f"❓ **Objeto '{object_name}' não encontrado exatamente**\\n\\n"
@@ -0,0 +1,326 @@
+# docs_index.py
+from array import array
+from collections import defaultdict
+from collections.abc import Mapping
+from functools import lru_cache
+import heapq
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+# Bump when the tables change, so that existing index files get rebuilt
+SCHEMA_VERSION = 3
+# BM25 weights of the columns of the full-text index, in table order
+SEARCH_WEIGHTS = {"name": 10.0, "digest": 4.0, "description": 1.0, "methods": 2.0, "attributes": 2.0}
+
+
+class DocsIndex:
+    """Object documentation from docs.json, served from an SQLite index.
+
+    The index is built on first use, next to docs.json unless index_path is
+    given, and rebuilt when docs.json is newer or the schema has changed. Only
+    the names are kept in memory; each entry is decoded when it is looked up.
+    """
+
+    def __init__(self, json_path: str, index_path: str = None):
+        self.json_path = json_path
+        self.index_path = index_path or os.path.splitext(json_path)[0] + ".sqlite"
+        self._db = None
+        self._names = None  # tuple of object names, in docs.json order
+        self._name_set = None
+        self._trigrams = None
+        self._catalog = None  # category -> tuple of names, in docs.json order
+        self._lock = threading.Lock()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = self._open()
+        return self._db
+
+    def _open(self) -> sqlite3.Connection:
+        if not self._is_fresh():
+            try:
+                self._build(self.index_path)
+            except (OSError, sqlite3.Error) as e:
+                # e.g. a read-only install: index in memory for this process only
+                logging.warning(f"Cannot write {self.index_path} ({e}), indexing in memory")
+                db = sqlite3.connect(":memory:", check_same_thread=False)
+                self._fill(db)
+                return db
+        return sqlite3.connect(
+            f"file:{self.index_path}?mode=ro", uri=True, check_same_thread=False
+        )
+
+    def _is_fresh(self) -> bool:
+        try:
+            if os.path.getmtime(self.index_path) < os.path.getmtime(self.json_path):
+                return False
+            with sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True) as db:
+                return db.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        except (OSError, sqlite3.Error):
+            return False
+
+    def _build(self, path: str):
+        # build aside and rename, so that concurrent readers never see half an index
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            db = sqlite3.connect(tmp_path)
+            try:
+                self._fill(db)
+            finally:
+                db.close()
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _fill(self, db: sqlite3.Connection):
+        with open(self.json_path, "r") as f:
+            docs = json.load(f)
+        db.execute(
+            "CREATE TABLE objects ("
+            " name TEXT PRIMARY KEY, category TEXT NOT NULL, position INTEGER NOT NULL,"
+            " doc TEXT NOT NULL, signature TEXT NOT NULL)"
+        )
+        rows = []
+        for category, obj_list in docs.items():
+            for obj in obj_list:
+                rows.append(
+                    (obj["name"], category, len(rows), json.dumps(obj), json.dumps(_signature(obj)))
+                )
+        # a name listed in several categories keeps its last entry, as before
+        db.executemany("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?)", rows)
+        db.execute(
+            f"CREATE VIRTUAL TABLE objects_fts USING fts5({', '.join(SEARCH_WEIGHTS)},"
+            " tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        db.executemany(
+            "INSERT INTO objects_fts (rowid, name, digest, description, methods, attributes)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (rowid, *_search_text(json.loads(doc)))
+                for rowid, doc in db.execute("SELECT rowid, doc FROM objects").fetchall()
+            ),
+        )
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        db.commit()
+
+    def names(self) -> tuple:
+        if self._names is None:
+            rows = self.db.execute("SELECT name FROM objects ORDER BY position")
+            self._names = tuple(name for (name,) in rows)
+        return self._names
+
+    def catalog(self) -> dict:
+        if self._catalog is None:
+            catalog = {}
+            rows = self.db.execute("SELECT category, name FROM objects ORDER BY position")
+            for category, name in rows:
+                catalog.setdefault(category, []).append(name)
+            self._catalog = {category: tuple(names) for category, names in catalog.items()}
+        return self._catalog
+
+    def list_names(
+        self, category: str = None, prefix: str = None, signal_only: bool = False
+    ) -> list:
+        """Object names, in docs.json order, filtered by category, name prefix and
+        whether they are MSP (signal, "~") objects."""
+        if category is None:
+            names = self.names()
+        else:
+            names = self.catalog()[category]
+        if prefix:
+            names = [name for name in names if name.startswith(prefix)]
+        if signal_only:
+            names = [name for name in names if name.endswith("~")]
+        return list(names)
+
+    def __contains__(self, name) -> bool:
+        if self._name_set is None:
+            self._name_set = frozenset(self.names())
+        return name in self._name_set
+
+    def suggest(self, name: str, k: int = 5) -> list:
+        """Up to k valid object names closest to a misspelled one, closest first."""
+        if self._trigrams is None:
+            self._trigrams = TrigramIndex(self.names())
+        return self._trigrams.suggest(name, k)
+
+    @lru_cache(maxsize=256)
+    def get(self, name: str) -> dict:
+        """The documentation of an object, or None if there is no such object."""
+        row = self.db.execute("SELECT doc FROM objects WHERE name = ?", (name,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    @lru_cache(maxsize=1024)
+    def signature(self, name: str) -> dict:
+        """The name, digest, inlets, outlets and arguments of an object, or None."""
+        row = self.db.execute("SELECT signature FROM objects WHERE name = ?", (name,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    @lru_cache(maxsize=None)
+    def ports(self, name: str) -> tuple:
+        """(inlet types, outlet types) of an object as documented, or None."""
+        signature = self.signature(name)
+        if signature is None:
+            return None
+        return (
+            tuple(inlet.get("type", "") for inlet in signature["inletlist"]),
+            tuple(outlet.get("type", "") for outlet in signature["outletlist"]),
+        )
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Objects matching any word of the query, best first, ranked by BM25 over
+        their name, digest, description, methods and attributes. The last word
+        also matches as a prefix."""
+        words = re.findall(r"\w+", query.lower())
+        if not words or limit <= 0:
+            return []
+        terms = [f'"{w}"' for w in words]
+        terms[-1] += "*"
+        weights = ", ".join(str(w) for w in SEARCH_WEIGHTS.values())
+        rows = self.db.execute(
+            "SELECT o.name, o.category, json_extract(o.doc, '$.digest'),"
+            f" bm25(objects_fts, {weights}) AS rank"
+            " FROM objects_fts JOIN objects o ON o.rowid = objects_fts.rowid"
+            " WHERE objects_fts MATCH ? ORDER BY rank LIMIT ?",
+            (" OR ".join(terms), limit),
+        )
+        return [
+            {"name": name, "category": category, "digest": digest, "score": round(-rank, 3)}
+            for name, category, digest, rank in rows
+        ]
+
+    def categories(self) -> dict:
+        """The whole of docs.json: category -> list of object docs."""
+        docs = {}
+        rows = self.db.execute("SELECT category, doc FROM objects ORDER BY position")
+        for category, doc in rows:
+            docs.setdefault(category, []).append(json.loads(doc))
+        return docs
+
+
+class TrigramIndex:
+    """Character trigram index over names, for "did you mean" suggestions.
+
+    Candidates are the names sharing the most trigrams with the query, then
+    ranked by edit distance, which counts a swap of two letters as one edit.
+    """
+
+    def __init__(self, names: tuple):
+        self.names = names
+        postings = defaultdict(list)
+        sizes = []
+        for i, name in enumerate(names):
+            grams = _trigrams(name)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(i)
+        self.postings = {gram: array("I", ids) for gram, ids in postings.items()}
+        self.sizes = array("I", sizes)
+
+    @lru_cache(maxsize=1024)
+    def suggest(self, name: str, k: int = 5) -> list:
+        grams = _trigrams(name)
+        shared = defaultdict(int)
+        for gram in grams:
+            for i in self.postings.get(gram, ()):
+                shared[i] += 1
+        # Jaccard similarity of the trigram sets
+        candidates = heapq.nlargest(
+            2 * k,
+            shared.items(),
+            key=lambda item: item[1] / (len(grams) + self.sizes[item[0]] - item[1]),
+        )
+        query = name.lower()
+        max_distance = max(2, len(query) // 3)
+        ranked = []
+        for rank, (i, _) in enumerate(candidates):
+            candidate = self.names[i]
+            distance = _edit_distance(query, candidate.lower(), max_distance)
+            if distance <= max_distance:
+                ranked.append((distance, rank, candidate))
+        return [candidate for _, _, candidate in sorted(ranked)[:k]]
+
+
+def _trigrams(name: str) -> set:
+    padded = f"  {name.lower()} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str, bound: int) -> int:
+    """Optimal string alignment distance (insertions, deletions, substitutions and
+    swaps of adjacent characters), or bound + 1 as soon as it exceeds bound."""
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > bound:
+            return bound + 1
+    return current[len(b)]
+
+
+def _signature(doc: dict) -> dict:
+    """Slim projection of an object doc: what is needed to create and connect it."""
+
+    def slim(entries, keys):
+        return [{key: e[key] for key in keys if key in e} for e in entries or []]
+
+    return {
+        "name": doc["name"],
+        "digest": doc.get("digest", ""),
+        "inletlist": slim(doc.get("inletlist"), ("id", "type", "digest")),
+        "outletlist": slim(doc.get("outletlist"), ("id", "type", "digest")),
+        "arguments": slim(doc.get("arguments"), ("name", "type", "optional", "digest")),
+    }
+
+
+def _search_text(doc: dict) -> tuple:
+    """Text of the columns of the full-text index for an object doc."""
+
+    def entries(key):
+        return " ".join(
+            f"{e.get('name', '')} {e.get('digest', '')}" for e in doc.get(key) or []
+        )
+
+    return (
+        doc["name"],
+        doc.get("digest") or "",
+        doc.get("description") or "",
+        entries("methods"),
+        entries("attributes"),
+    )
+
+
+class LazyDocs(Mapping):
+    """Read-only name -> doc mapping over a DocsIndex, decoding entries on access."""
+
+    def __init__(self, index: DocsIndex):
+        self.index = index
+
+    def __getitem__(self, name):
+        doc = self.index.get(name) if name in self.index else None
+        if doc is None:
+            raise KeyError(name)
+        return doc
+
+    def __iter__(self):
+        return iter(self.index.names())
+
+    def __len__(self):
+        return len(self.index.names())
+
+    def __contains__(self, name):
+        return name in self.index
@@ -0,0 +1,234 @@
+# layout.py
+from collections import defaultdict
+
+# Rows a patch cord may span and still take part in ordering the rows. Each row
+# crossed costs a dummy node, so longer cords are left out: on deep patches
+# their dummies made the layout take tens of seconds.
+MAX_DUMMY_SPAN = 8
+
+
+def layered_layout(
+    rects: dict,
+    lines,
+    origin=(0, 0),
+    h_gap: float = 20,
+    v_gap: float = 40,
+    sweeps: int = 4,
+) -> dict:
+    """Top-to-bottom layered (Sugiyama) layout of a patch.
+
+    Args:
+        rects: varname -> [left, top, right, bottom] rect of each box to place.
+        lines: (src_varname, outlet_idx, dst_varname, inlet_idx) patch cords;
+            cords to boxes not in rects are ignored.
+        origin: [x, y] of the top left corner of the layout.
+        h_gap, v_gap: Space between boxes of a row and between rows.
+        sweeps: Number of down and up barycenter sweeps to reduce crossings.
+            Cords spanning more than MAX_DUMMY_SPAN rows are not considered.
+
+    Returns:
+        dict: varname -> new [x, y] top left position of the box.
+    """
+    # visit boxes top to bottom, so that cycles are broken against the flow
+    names = sorted(rects, key=lambda v: (rects[v][1], rects[v][0]))
+    index = {v: i for i, v in enumerate(names)}
+    n = len(names)
+    ports = {}  # (u, v) -> (outlet_idx, inlet_idx) of one cord between them
+    for src, outlet, dst, inlet in lines:
+        if src in index and dst in index and src != dst:
+            ports.setdefault((index[src], index[dst]), (outlet, inlet))
+
+    edges = _break_cycles(n, ports)
+    layer = _assign_layers(n, edges)
+
+    # split cords spanning several rows with dummy nodes, one per row crossed
+    width = [rects[v][2] - rects[v][0] for v in names]
+    height = [rects[v][3] - rects[v][1] for v in names]
+    preds = defaultdict(list)  # node -> [(pred, outlet fraction)]
+    succs = defaultdict(list)  # node -> [(succ, inlet fraction)]
+    max_outlet = defaultdict(int)
+    max_inlet = defaultdict(int)
+    for (u, v), (outlet, inlet) in ports.items():
+        max_outlet[u] = max(max_outlet[u], outlet)
+        max_inlet[v] = max(max_inlet[v], inlet)
+    for u, v in edges:
+        if layer[v] - layer[u] > MAX_DUMMY_SPAN:
+            continue
+        outlet, inlet = ports.get((u, v), ports.get((v, u), (0, 0)))
+        out_frac = outlet / (max_outlet[u] + 1)
+        in_frac = inlet / (max_inlet[v] + 1)
+        prev = u
+        for row in range(layer[u] + 1, layer[v]):
+            dummy = len(layer)
+            layer.append(row)
+            width.append(0)
+            height.append(0)
+            succs[prev].append((dummy, 0))
+            preds[dummy].append((prev, out_frac if prev == u else 0))
+            prev = dummy
+        succs[prev].append((v, in_frac))
+        preds[v].append((prev, out_frac if prev == u else 0))
+
+    rows = [[] for _ in range(max(layer, default=-1) + 1)]
+    # keep the current left to right order as the starting point
+    for node in sorted(range(len(layer)), key=lambda i: rects[names[i]][0] if i < n else 0):
+        rows[layer[node]].append(node)
+
+    rows = _order_rows(rows, preds, succs, sweeps)
+    x = _assign_x(rows, preds, succs, width, h_gap)
+
+    left = min(x[node] for node in range(n)) if n else 0
+    positions = {}
+    top = origin[1]
+    for row in rows:
+        for node in row:
+            if node < n:
+                positions[names[node]] = [round(origin[0] + x[node] - left), round(top)]
+        top += max((height[node] for node in row), default=0) + v_gap
+    return positions
+
+
+def _break_cycles(n: int, ports: dict) -> set:
+    """Edges of the graph with the back edges of a depth-first search reversed."""
+    succ = [[] for _ in range(n)]
+    for u, v in ports:
+        succ[u].append(v)
+    state = [0] * n  # 0: not visited, 1: on the stack, 2: done
+    edges = set()
+    for root in range(n):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(succ[root]))]
+        while stack:
+            u, children = stack[-1]
+            for v in children:
+                if state[v] == 1:
+                    edges.add((v, u))
+                    continue
+                edges.add((u, v))
+                if state[v] == 0:
+                    state[v] = 1
+                    stack.append((v, iter(succ[v])))
+                    break
+            else:
+                state[u] = 2
+                stack.pop()
+    return edges
+
+
+def _assign_layers(n: int, edges: set) -> list:
+    """Longest path layering, with sources pulled down next to their successors."""
+    succ = [[] for _ in range(n)]
+    indegree = [0] * n
+    for u, v in edges:
+        succ[u].append(v)
+        indegree[v] += 1
+    order = [u for u in range(n) if not indegree[u]]
+    sources = set(order)
+    layer = [0] * n
+    for u in order:  # grows while iterating: a topological order
+        for v in succ[u]:
+            layer[v] = max(layer[v], layer[u] + 1)
+            indegree[v] -= 1
+            if not indegree[v]:
+                order.append(v)
+    for u in sources:
+        if succ[u]:
+            layer[u] = min(layer[v] for v in succ[u]) - 1
+    return layer
+
+
+def _order_rows(rows: list, preds: dict, succs: dict, sweeps: int) -> list:
+    """Reorder the nodes of each row by the barycenter of their neighbours in the
+    row above (down sweeps) or below (up sweeps), keeping the order with the
+    fewest crossings."""
+    best, best_crossings = [list(row) for row in rows], _crossings(rows, succs)
+    for sweep in range(2 * sweeps):
+        down = sweep % 2 == 0
+        neighbours = preds if down else succs
+        indices = range(1, len(rows)) if down else range(len(rows) - 2, -1, -1)
+        for i in indices:
+            fixed = rows[i - 1] if down else rows[i + 1]
+            position = {node: p for p, node in enumerate(fixed)}
+            keys = {}
+            for p, node in enumerate(rows[i]):
+                adjacent = neighbours.get(node)
+                if adjacent:
+                    keys[node] = sum(position[w] + frac for w, frac in adjacent) / len(adjacent)
+                else:
+                    keys[node] = p
+            rows[i].sort(key=keys.__getitem__)
+        crossings = _crossings(rows, succs)
+        if crossings <= best_crossings:
+            best, best_crossings = [list(row) for row in rows], crossings
+        if not crossings and not down:
+            break
+    return best
+
+
+def _crossings(rows: list, succs: dict) -> int:
+    """Number of crossing cords between consecutive rows."""
+    total = 0
+    for upper, lower in zip(rows, rows[1:]):
+        position = {node: p for p, node in enumerate(lower)}
+        targets = [p for u in upper for p in sorted(position[w] for w, _ in succs.get(u, ()))]
+        # count inversions with a Fenwick tree over the positions of the lower row
+        tree = [0] * (len(lower) + 1)
+        for seen, p in enumerate(targets):
+            i, smaller_or_equal = p + 1, 0
+            while i:
+                smaller_or_equal += tree[i]
+                i -= i & -i
+            total += seen - smaller_or_equal
+            i = p + 1
+            while i <= len(lower):
+                tree[i] += 1
+                i += i & -i
+    return total
+
+
+def _assign_x(rows: list, preds: dict, succs: dict, width: list, h_gap: float) -> list:
+    """Left x of every node: each node as close as possible to the mean centre of
+    its neighbours in the previous row, alternating down and up passes."""
+    x = [0.0] * len(width)
+    for row in rows:
+        left = 0
+        for node in row:
+            x[node] = left
+            left += width[node] + h_gap
+    for down in (True, False, True, False):
+        neighbours = preds if down else succs
+        for row in (rows[1:] if down else rows[-2::-1]):
+            desired = []
+            for node in row:
+                adjacent = neighbours.get(node)
+                if adjacent:
+                    centre = sum(x[w] + width[w] / 2 for w, _ in adjacent) / len(adjacent)
+                    desired.append(centre - width[node] / 2)
+                else:
+                    desired.append(x[node])
+            for node, left in zip(row, _pack_row(desired, [width[v] for v in row], h_gap)):
+                x[node] = left
+    return x
+
+
+def _pack_row(desired: list, widths: list, h_gap: float) -> list:
+    """Left x of each box of a row, in order and without overlaps, at the least
+    squared distance from the desired ones (pool adjacent violators)."""
+    offsets, offset = [], 0
+    for w in widths:
+        offsets.append(offset)
+        offset += w + h_gap
+    blocks = []  # [mean, count] of pooled boxes, in terms of desired - offset
+    for d, o in zip(desired, offsets):
+        blocks.append([d - o, 1])
+        while len(blocks) > 1 and blocks[-2][0] > blocks[-1][0]:
+            mean, count = blocks.pop()
+            previous = blocks[-1]
+            previous[0] = (previous[0] * previous[1] + mean * count) / (previous[1] + count)
+            previous[1] += count
+    lefts = []
+    for mean, count in blocks:
+        lefts.extend([mean] * count)
+    return [left + o for left, o in zip(lefts, offsets)]
@@ -0,0 +1,82 @@
+# metrics.py
+from bisect import bisect_left
+from collections import defaultdict, deque
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+RECENT_SAMPLES = 1000  # recent latencies kept for exact percentiles
+
+
+class Histogram:
+    """Latency histogram: counts per bucket since startup, plus the recent
+    samples for percentiles. Recording is O(log buckets)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)  # the last one is unbounded
+        self.total = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def snapshot(self) -> dict:
+        count = sum(self.counts)
+        if not count:
+            return {"count": 0}
+        samples = sorted(self.recent)
+        bounds = [f"le_{bound}ms" for bound in BUCKETS_MS] + ["le_inf"]
+        return {
+            "count": count,
+            "mean_ms": round(self.total / count * 1000, 3),
+            **{
+                f"p{p}_ms": round(samples[len(samples) * p // 100] * 1000, 3)
+                for p in (50, 95, 99)
+            },
+            # cumulative, as Prometheus histograms
+            "buckets": dict(zip(bounds, _cumulative(self.counts))),
+        }
+
+
+def _cumulative(counts: list) -> list:
+    total, out = 0, []
+    for n in counts:
+        total += n
+        out.append(total)
+    return out
+
+
+class CallMetrics:
+    """Counters of the calls of one action or tool."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.latency = Histogram()
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "latency": self.latency.snapshot(),
+        }
+
+
+class Metrics:
+    """CallMetrics by name, created on first use."""
+
+    def __init__(self):
+        self.calls = defaultdict(CallMetrics)
+
+    def __getitem__(self, name: str) -> CallMetrics:
+        return self.calls[name]
+
+    def snapshot(self) -> dict:
+        return {name: metrics.snapshot() for name, metrics in sorted(self.calls.items())}
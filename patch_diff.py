@@ -0,0 +1,141 @@
+# patch_diff.py
+
+
+def box_text(box: dict) -> str:
+    """Class and arguments of a box as one normalised string, e.g. "cycle~ 440",
+    whether the box was read from Max or added by the server."""
+    words = (box.get("text") or "").split()
+    maxclass = box.get("maxclass")
+    if maxclass == "newobj" or words[:1] == [maxclass]:
+        return " ".join(words)
+    return " ".join([maxclass, *words])
+
+
+def object_text(obj: dict) -> str:
+    return " ".join(str(a) for a in [obj["obj_type"], *(obj.get("args") or [])])
+
+
+def diff_patch(
+    boxes: dict,
+    lines: set,
+    attributes: dict,
+    objects: list,
+    connections: list = (),
+    attribute_sets: list = (),
+    prune: bool = True,
+) -> list:
+    """The shortest list of commands turning a patch into the desired one.
+
+    boxes, lines and attributes describe the current patch, as in the patch
+    mirror. The desired patch is described as for build_subgraph, with the
+    varnames (or refs) of the objects as their identity:
+
+    - a box whose class or arguments differ is removed and added again, with
+      the patch cords it should keep;
+    - a box that only moved is moved, all moves making one move_objects command;
+    - boxes not in objects are removed if prune, else left alone, and so are
+      the cords between them;
+    - attributes are only set when they differ from the known value.
+
+    Commands run in order: disconnections, removals, additions, moves,
+    connections and attribute sets.
+    """
+    desired = {}
+    for obj in objects:
+        varname = obj.get("varname") or obj.get("ref")
+        if not varname:
+            raise ValueError(f"Object needs a ref or a varname: {obj}")
+        if "obj_type" not in obj:
+            raise ValueError(f"Object {varname} is missing obj_type.")
+        if varname in desired:
+            raise ValueError(f"Object {varname} is described twice.")
+        position = obj.get("position")
+        if position is not None and len(position) != 2:
+            raise ValueError(f"Position of {varname} must be a list of two integers.")
+        desired[varname] = obj
+    refs = {obj.get("ref", varname): varname for varname, obj in desired.items()}
+
+    def resolve(name: str) -> str:
+        varname = refs.get(name, name)
+        if varname not in desired and (prune or varname not in boxes):
+            raise ValueError(f"Unknown object: {name}")
+        return varname
+
+    wanted_lines = {
+        (
+            resolve(c["src"]),
+            c.get("outlet_idx", 0),
+            resolve(c["dst"]),
+            c.get("inlet_idx", 0),
+        )
+        for c in connections
+    }
+
+    removed, added, positions = [], [], {}
+    for varname, obj in desired.items():
+        box = boxes.get(varname)
+        if box is not None and box_text(box) == object_text(obj):
+            x, y = obj.get("position") or box["patching_rect"][:2]
+            if [x, y] != list(box["patching_rect"][:2]):
+                positions[varname] = [x, y]
+            continue
+        if box is not None:
+            removed.append(varname)
+        position = obj.get("position")
+        if position is None:
+            position = box["patching_rect"][:2] if box is not None else [0, 0]
+        added.append(
+            {
+                "action": "add_object",
+                "position": list(position),
+                "obj_type": obj["obj_type"],
+                "args": obj.get("args", []),
+                "varname": varname,
+            }
+        )
+    if prune:
+        removed += [varname for varname in boxes if varname not in desired]
+    gone = set(removed)
+
+    operations = []
+    # cords of removed boxes go with them; others are only managed between
+    # described boxes unless pruning
+    for line in sorted(lines - wanted_lines, key=str):
+        src, _, dst, _ = line
+        if src in gone or dst in gone:
+            continue
+        if prune or (src in desired and dst in desired):
+            operations.append(_line_command("disconnect_objects", line))
+    operations += [{"action": "remove_object", "varname": varname} for varname in removed]
+    operations += added
+    if positions:
+        operations.append({"action": "move_objects", "positions": positions})
+    for line in sorted(wanted_lines, key=str):
+        src, _, dst, _ = line
+        if line not in lines or src in gone or dst in gone:
+            operations.append(_line_command("connect_objects", line))
+    for attr in attribute_sets:
+        varname = resolve(attr["target"])
+        known = attributes.get(varname)
+        if varname not in gone and known and known.get(attr["attr_name"]) == attr["attr_value"]:
+            continue
+        operations.append(
+            {
+                "action": "set_object_attribute",
+                "varname": varname,
+                "attr_name": attr["attr_name"],
+                "attr_value": attr["attr_value"],
+            }
+        )
+    return operations
+
+
+def _line_command(action: str, line: tuple) -> dict:
+    src, outlet_idx, dst, inlet_idx = line
+    return {
+        "action": action,
+        "src_varname": src,
+        "outlet_idx": outlet_idx,
+        "dst_varname": dst,
+        "inlet_idx": inlet_idx,
+    }
@@ -0,0 +1,106 @@
+# scheduler.py
+import asyncio
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+REALTIME = "realtime"
+# Bytes a lane of weight 1 may send per round of deficit round robin
+QUANTUM = 4096
+
+
+class Scheduler:
+    """Decides when the messages to Max may be sent.
+
+    Realtime messages (parameter changes) are never held back. The other lanes
+    share a window of messages in flight, i.e. sent and not yet answered by
+    Max, and a lane may have a limit of its own. Waiting messages keep their
+    order within their lane and the lanes take turns by deficit round robin,
+    each getting a share of the bytes sent in proportion to its weight.
+
+    A realtime message about an object that a waiting message refers to (e.g.
+    one that is yet to be added) waits behind it in that message's lane.
+    """
+
+    def __init__(self, window: int, weights: dict, limits: dict = None):
+        self.window = window
+        self.weights = weights
+        self.limits = limits or {}
+        self.in_flight = 0
+        self._lane_in_flight = dict.fromkeys(weights, 0)
+        self._queues = {lane: deque() for lane in weights}  # (size, keys, future)
+        self._keys = {lane: Counter() for lane in weights}  # keys of waiting messages
+        self._deficit = dict.fromkeys(weights, 0)
+        # lanes with waiting messages and under their limit, in round robin order
+        self._active = deque()
+
+    def waiting(self) -> dict:
+        return {lane: len(queue) for lane, queue in self._queues.items()}
+
+    @asynccontextmanager
+    async def turn(self, lane: str, size: int = 0, keys: tuple = ()):
+        """Wait for the turn of a message of `size` bytes, referring to the objects
+        in `keys`; its slot of the window is held until the block exits."""
+        if lane == REALTIME:
+            lane = next(
+                (l for l, counts in self._keys.items() if any(k in counts for k in keys)),
+                REALTIME,
+            )
+            if lane == REALTIME:
+                yield
+                return
+        future = asyncio.get_event_loop().create_future()
+        queue = self._queues[lane]
+        if not queue and not self._full(lane):
+            self._active.append(lane)
+        queue.append((size, keys, future))
+        self._keys[lane].update(keys)
+        self._grant()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(lane)  # granted just before being cancelled
+            raise
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def _full(self, lane: str) -> bool:
+        limit = self.limits.get(lane)
+        return limit is not None and self._lane_in_flight[lane] >= limit
+
+    def _release(self, lane: str):
+        self.in_flight -= 1
+        self._lane_in_flight[lane] -= 1
+        if self._queues[lane] and lane not in self._active and not self._full(lane):
+            self._active.append(lane)
+        self._grant()
+
+    def _grant(self):
+        while self.in_flight < self.window and self._active:
+            lane = self._active[0]
+            queue = self._queues[lane]
+            size, keys, future = queue[0]
+            if future.done():  # cancelled while waiting
+                pass
+            elif size > self._deficit[lane]:
+                # next lane, which gets its quantum for this round
+                self._active.rotate(-1)
+                next_lane = self._active[0]
+                self._deficit[next_lane] += QUANTUM * self.weights[next_lane]
+                continue
+            else:
+                self._deficit[lane] -= size
+                self.in_flight += 1
+                self._lane_in_flight[lane] += 1
+                future.set_result(None)
+            queue.popleft()
+            counts = self._keys[lane]
+            for key in keys:
+                counts[key] -= 1
+                if not counts[key]:
+                    del counts[key]
+            if not queue or self._full(lane):
+                self._deficit[lane] = 0
+                self._active.popleft()
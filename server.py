@@ -4,81 +4,1193 @@ from contextlib import asynccontextmanager
 import asyncio
 import socketio
 
-from typing import Callable, Any
+from typing import Callable, Any, Optional
+from spatial_index import SpatialGrid
+from layout import layered_layout
+from docs_index import DocsIndex, LazyDocs
+from metrics import Metrics
+from templates import Template, TemplateRegistry
+from patch_diff import box_text, diff_patch
+from scheduler import REALTIME, Scheduler
+from streaming import ParameterStream
 import logging
 import uuid
 import os
 import json
+import time
+import random
+import zlib
+import inspect
+from collections import defaultdict, deque
+
+try:
+    import msgpack
+except ImportError:  # fall back to JSON responses
+    msgpack = None
 
 SOCKETIO_SERVER_URL = os.environ.get("SOCKETIO_SERVER_URL", "http://127.0.0.1")
 SOCKETIO_SERVER_PORT = os.environ.get("SOCKETIO_SERVER_PORT", "5002")
 NAMESPACE = os.environ.get("NAMESPACE", "/mcp")
+# Wait for Max to acknowledge each command, and how many messages may await an
+# answer from Max at once (parameter changes are not counted)
+ACK_COMMANDS = os.environ.get("ACK_COMMANDS", "0") == "1"
+COMMAND_WINDOW = int(os.environ.get("COMMAND_WINDOW", "32"))
+# Lanes of the outbound scheduler: parameter changes are sent first; reads and
+# single edits share the window with bulk edits in proportion to their weights
+REALTIME_ACTIONS = {
+    "set_number",
+    "set_numbers",
+    "send_message_to_object",
+    "send_messages",
+    "send_bang_to_object",
+}
+BULK_ACTIONS = {"apply_batch", "move_objects"}
+LANE_WEIGHTS = {"interactive": 4, "bulk": 1}
+# Bulk edits awaiting an answer from Max at once; each may delay parameter changes
+BULK_IN_FLIGHT = int(os.environ.get("BULK_IN_FLIGHT", "1"))
+# Times per second that stream_parameters sends the latest values, at most
+STREAM_RATE = float(os.environ.get("STREAM_RATE", "200"))
+# apply_batch requests are split in chunks of this many operations, between which
+# other messages reach Max
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "100"))
+# Several Max instances as "name=url:port,name=url:port"; defaults to the single
+# instance given by SOCKETIO_SERVER_URL and SOCKETIO_SERVER_PORT.
+MAXMSP_ENDPOINTS = os.environ.get("MAXMSP_ENDPOINTS", "")
+# Special targets: send to every endpoint, or to the one answering fastest
+BROADCAST_TARGET = "all"
+FASTEST_TARGET = "fastest"
+# Reconnection backoff (seconds) and how many commands to keep while disconnected
+RECONNECT_DELAY = float(os.environ.get("RECONNECT_DELAY", "0.05"))
+RECONNECT_DELAY_MAX = float(os.environ.get("RECONNECT_DELAY_MAX", "0.5"))
+REPLAY_BUFFER_SIZE = int(os.environ.get("REPLAY_BUFFER_SIZE", "1000"))
+# Read-only requests that identical concurrent callers share, and for how many
+# seconds a finished one may still be reused (0 disables reuse)
+COALESCED_ACTIONS = {
+    "get_objects_in_patch",
+    "get_objects_in_selected",
+    "get_object_attributes",
+    "get_avoid_rect_position",
+    "get_patch_changes",
+}
+COALESCE_TTL = float(os.environ.get("COALESCE_TTL", "0"))
+# Request timeouts (seconds) are derived from measured round trips, within bounds;
+# DEFAULT_TIMEOUT applies until an action has been measured
+DEFAULT_TIMEOUT = float(os.environ.get("DEFAULT_TIMEOUT", "2.0"))
+# a lower floor rejected replies that Max sent after stalling for about 0.4 s
+MIN_TIMEOUT = float(os.environ.get("MIN_TIMEOUT", "1.0"))
+MAX_TIMEOUT = float(os.environ.get("MAX_TIMEOUT", "30.0"))
+# Actions whose duration grows with the number of boxes in the patch
+SIZED_ACTIONS = {"get_objects_in_patch", "get_objects_in_selected", "get_patch_changes"}
+# Seconds between full snapshots reconciling the patch mirror (0 disables)
+MIRROR_RECONCILE_INTERVAL = float(os.environ.get("MIRROR_RECONCILE_INTERVAL", "0"))
+# Log the whole payload of every message to Max, at INFO (costly for big patches)
+LOG_PAYLOADS = os.environ.get("LOG_PAYLOADS", "0") == "1"
+# Refuse to add objects whose type is not in docs.json instead of only warning
+REJECT_UNKNOWN_OBJECTS = os.environ.get("REJECT_UNKNOWN_OBJECTS", "0") == "1"
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 docs_path = os.path.join(current_dir, "docs.json")
-with open(docs_path, "r") as f:
-    docs = json.load(f)
-flattened_docs = {}
-for obj_list in docs.values():
-    for obj in obj_list:
-        flattened_docs[obj["name"]] = obj
+# SQLite index of docs.json, built on first use (default: docs.sqlite next to it)
+DOCS_INDEX_PATH = os.environ.get("DOCS_INDEX_PATH") or None
+docs_index = DocsIndex(docs_path, DOCS_INDEX_PATH)
+flattened_docs = LazyDocs(docs_index)
+# Directory of the patch templates, one JSON file each
+TEMPLATES_DIR = os.environ.get("TEMPLATES_DIR") or os.path.join(current_dir, "templates")
+# Classes whose inlets and outlets are set by their contents (a gen patch, a
+# subpatcher, a script...) rather than by their documentation
+CONTENT_DEFINED_CLASSES = {
+    "bpatcher",
+    "gen",
+    "gen~",
+    "jit.gen",
+    "jit.gl.pix",
+    "jit.pix",
+    "js",
+    "jsui",
+    "mc.gen~",
+    "mc.poly~",
+    "mc.rnbo~",
+    "node.script",
+    "p",
+    "patcher",
+    "pfft~",
+    "poly~",
+    "rnbo~",
+    "v8",
+    "v8ui",
+}
+
+
+def check_object_type(obj_type: str) -> Optional[dict]:
+    """None if obj_type is documented, else an error with the closest valid names."""
+    if obj_type in docs_index:
+        return None
+    return {
+        "error": f"Unknown object type: {obj_type}",
+        "suggestions": docs_index.suggest(obj_type),
+    }
+
+
+def unknown_object_types(obj_types) -> dict:
+    """obj_type -> check_object_type error of each undocumented type among obj_types,
+    with a "message" giving the error and the closest valid names in one line."""
+    unknown = {}
+    for obj_type in obj_types:
+        if obj_type and obj_type not in unknown and obj_type not in docs_index:
+            error = check_object_type(obj_type)
+            suggestions = ", ".join(error["suggestions"]) or "nothing close"
+            unknown[obj_type] = {**error, "message": f"{error['error']} (did you mean {suggestions}?)"}
+    return unknown
+
+
+def box_class(box: dict) -> tuple:
+    """(class name, whether the box has arguments) of a box of the patch mirror."""
+    words = (box.get("text") or "").split()
+    if box.get("maxclass") == "newobj" and words:
+        return words[0], len(words) > 1
+    return box.get("maxclass"), len(words) > 1
+
+
+def connection_error(src: dict, outlet_idx: int, dst: dict, inlet_idx: int) -> str:
+    """Why a patch cord between two boxes cannot work according to the documented
+    inlets and outlets of their classes, or None if it can or cannot be judged,
+    as for the classes in CONTENT_DEFINED_CLASSES."""
+    if outlet_idx < 0 or inlet_idx < 0:
+        return "Outlet and inlet indices must be 0 or more."
+    src_class, src_has_args = box_class(src)
+    dst_class, dst_has_args = box_class(dst)
+    outlet_type = inlet_type = None
+    if src_class in docs_index and src_class not in CONTENT_DEFINED_CLASSES:
+        outlets = docs_index.ports(src_class)[1]
+        if outlet_idx < len(outlets):
+            outlet_type = outlets[outlet_idx]
+        elif not src_has_args:
+            # arguments can add outlets (trigger, route...), so only without any
+            return f"{src_class} has {len(outlets)} outlet(s), no outlet {outlet_idx}."
+    if dst_class in docs_index and dst_class not in CONTENT_DEFINED_CLASSES:
+        inlets = docs_index.ports(dst_class)[0]
+        if inlet_idx < len(inlets):
+            inlet_type = inlets[inlet_idx]
+        elif not dst_has_args:
+            return f"{dst_class} has {len(inlets)} inlet(s), no inlet {inlet_idx}."
+    if outlet_type and inlet_type and "signal" in outlet_type and "signal" not in inlet_type:
+        return (
+            f"Outlet {outlet_idx} of {src_class} sends a signal, "
+            f"but inlet {inlet_idx} of {dst_class} does not accept signals."
+        )
+    return None
+
+
+def batch_boxes(operations: list) -> dict:
+    """varname -> box, as in the patch mirror, of the objects added by operations."""
+    return {
+        op["varname"]: {
+            "maxclass": op["obj_type"],
+            "text": " ".join(str(a) for a in [op["obj_type"], *(op.get("args") or [])]),
+        }
+        for op in operations
+        if op["action"] == "add_object"
+    }
+
+
+def __getattr__(name):
+    # `docs` (category -> object docs) is only decoded when someone imports it
+    if name == "docs":
+        return docs_index.categories()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 io_server_started = False
 
 
+def unpack_response(frame: bytes) -> dict:
+    """Decode a packed response: one flag byte (0 = msgpack,
+    1 = zlib-compressed msgpack) followed by the body."""
+    body = memoryview(frame)[1:]
+    if frame[0] == 1:
+        body = zlib.decompress(body)
+    return msgpack.unpackb(body, raw=False)
+
+
+def estimate_box_size(text: str) -> list:
+    """Approximate [width, height] of a new object box from its text."""
+    return [max(32, 7 * len(text) + 12), 22]
+
+
+def message_lane(payload: dict) -> str:
+    """Lane of the outbound scheduler for a message to Max."""
+    action = payload.get("action")
+    if action in REALTIME_ACTIONS:
+        return REALTIME
+    return "bulk" if action in BULK_ACTIONS else "interactive"
+
+
+def message_keys(payload: dict) -> tuple:
+    """Varnames of the objects a message to Max refers to."""
+    if payload.get("action") == "apply_batch":
+        return tuple({op["varname"] for op in payload["operations"] if "varname" in op})
+    if payload.get("action") == "set_numbers":
+        return tuple(payload["values"])
+    if payload.get("action") == "send_messages":
+        return tuple({m.get("varname") for m in payload["messages"]})
+    varname = payload.get("varname")
+    return (varname,) if varname else ()
+
+
+def log_message(what: str, payload: dict):
+    """Log a message to Max. Payloads can be large, so they are only formatted
+    with LOG_PAYLOADS; otherwise only the action is logged, at debug level."""
+    if LOG_PAYLOADS:
+        logging.info("%s: %s", what, payload)
+    else:
+        logging.debug("%s: %s", what, payload.get("action"))
+
+
+class LatencyTracker:
+    """Round trip times of one action.
+
+    Keeps a smoothed estimate and its variation, as TCP does for its
+    retransmission timeout (RFC 6298), to derive timeouts. Samples are
+    normalised by a size factor so that one estimate serves small and large
+    patches.
+    """
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+
+    def record(self, elapsed: float, size_factor: float = 1.0):
+        sample = elapsed / size_factor
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+
+    def timeout(self, size_factor: float = 1.0) -> float:
+        if self.srtt is None:
+            timeout = DEFAULT_TIMEOUT * size_factor
+        else:
+            timeout = (self.srtt + 4 * self.rttvar) * size_factor
+        return min(max(timeout, MIN_TIMEOUT), MAX_TIMEOUT)
+
+
+class PatchMirror:
+    """In-memory copy of the boxes and patch cords of a Max patch.
+
+    Updated optimistically from the commands sent by this server and reconciled
+    with full snapshots from Max. `version` increases on every change.
+
+    Commands that changed the mirror stay unconfirmed until Max acknowledges
+    them; fire-and-forget ones never are. A command Max rejected or never got
+    leaves a ghost that only a full snapshot removes, so reads take one while
+    any change is unconfirmed.
+    """
+
+    def __init__(self):
+        # varname -> box, as in the snapshots from Max, where "patching_rect" is
+        # the [left, top, right, bottom] rect of the box and "nested" marks the
+        # boxes inside subpatchers
+        self.boxes = {}
+        self.grid = SpatialGrid()  # the rects of the boxes, by varname
+        self.lines = set()  # (src_varname, outlet_idx, dst_varname, inlet_idx)
+        self.attributes = {}  # varname -> attributes last fetched from Max
+        self.avoid_rect = None
+        self.version = 0
+        self.max_version = None  # change counter of max_mcp.js at the last sync
+        self.synced = False  # False until a full snapshot has been loaded
+        self.unconfirmed = 0  # optimistic changes not acknowledged by Max
+        self._snapshot = None  # (version, snapshot) cache
+
+    def invalidate(self):
+        """Force the next read to go to Max, e.g. after a command failed."""
+        self.synced = False
+        self.avoid_rect = None
+
+    def _set_box(self, box: dict):
+        self.boxes[box["varname"]] = box
+        self.grid.insert(box["varname"], box["patching_rect"])
+
+    def _move_box(self, varname: str, rect: list):
+        self.boxes[varname]["patching_rect"] = rect
+        self.grid.insert(varname, rect)
+
+    def _drop_box(self, varname: str) -> bool:
+        self.grid.remove(varname)
+        self.attributes.pop(varname, None)
+        return self.boxes.pop(varname, None) is not None
+
+    def load_snapshot(self, snapshot: dict):
+        """Replace the mirror with a full snapshot from get_objects_in_patch. The
+        attributes read from Max are kept for the boxes that are still there and
+        unchanged, as far as the mirror knows."""
+        old_boxes = self.boxes
+        self.boxes = {}
+        self.grid.clear()
+        for b in snapshot["boxes"]:
+            self._set_box(b["box"])
+        self.lines = {
+            (*l["patchline"]["source"], *l["patchline"]["destination"])
+            for l in snapshot["lines"]
+        }
+        for varname in list(self.attributes):
+            old, new = old_boxes.get(varname), self.boxes.get(varname)
+            if new is None or old is not None and (
+                box_text(old) != box_text(new)
+                or list(old["patching_rect"]) != list(new["patching_rect"])
+            ):
+                del self.attributes[varname]
+        self.avoid_rect = None
+        self.max_version = snapshot.get("version")
+        self.version += 1
+        self.synced = True
+        self.unconfirmed = 0
+
+    def apply_changes(self, since_version: int, delta: dict):
+        """Apply the result of get_patch_changes, if it continues from the last sync."""
+        if delta["full"]:
+            self.load_snapshot(delta)
+            return
+        if not self.synced or since_version != self.max_version:
+            return
+        for change in delta["changes"]:
+            kind = change["type"]
+            if kind == "box_added":
+                self._set_box(change["box"])
+            elif kind == "box_removed":
+                self._drop_box(change["varname"])
+            elif kind == "box_moved" and change["varname"] in self.boxes:
+                self._move_box(change["varname"], change["patching_rect"])
+            elif kind in ("line_added", "line_removed"):
+                line = change["patchline"]
+                line = (*line["source"], *line["destination"])
+                if kind == "line_added":
+                    self.lines.add(line)
+                else:
+                    self.lines.discard(line)
+        self.max_version = delta["version"]
+        if delta["changes"]:
+            self.version += 1
+
+    def top_level(self) -> tuple:
+        """(boxes, lines) of the patcher itself, leaving out the boxes inside its
+        subpatchers and their patch cords."""
+        boxes = {v: box for v, box in self.boxes.items() if not box.get("nested")}
+        lines = {l for l in self.lines if l[0] in boxes and l[2] in boxes}
+        return boxes, lines
+
+    def snapshot(self) -> dict:
+        """Boxes and lines in the format of get_objects_in_patch, plus the change
+        counter of max_mcp.js ("version") and of this mirror ("mirror_version")."""
+        key = (self.version, self.max_version)
+        if self._snapshot is None or self._snapshot[0] != key:
+            self._snapshot = (
+                key,
+                {
+                    "boxes": [{"box": box} for box in self.boxes.values()],
+                    "lines": [
+                        {"patchline": {"source": [s, o], "destination": [d, i]}}
+                        for s, o, d, i in self.lines
+                    ],
+                    "version": self.max_version,
+                    "mirror_version": self.version,
+                },
+            )
+        return self._snapshot[1]
+
+    def apply_command(self, cmd: dict) -> bool:
+        """Apply the expected effect of a command sent to Max; True if it changed
+        the boxes or patch cords, which stay unconfirmed until `confirm`."""
+        changed = self._apply(cmd)
+        if changed:
+            self.unconfirmed += 1
+        return changed
+
+    def confirm(self):
+        """Max acknowledged a command that changed the mirror."""
+        self.unconfirmed = max(self.unconfirmed - 1, 0)
+
+    def _apply(self, cmd: dict) -> bool:
+        action = cmd.get("action")
+        if action == "apply_batch":
+            changed = [self._apply(op) for op in cmd["operations"]]
+            return any(changed)
+        varname = cmd.get("varname")
+        if action == "add_object":
+            text = " ".join(str(a) for a in [cmd["obj_type"], *(cmd.get("args") or [])])
+            x, y = cmd["position"]
+            width, height = estimate_box_size(text)
+            self._set_box(
+                {
+                    "maxclass": cmd["obj_type"],
+                    "varname": varname,
+                    "patching_rect": [x, y, x + width, y + height],
+                    "text": text,
+                }
+            )
+        elif action == "remove_object":
+            if not self._drop_box(varname):
+                return False
+            self.lines = {l for l in self.lines if varname not in (l[0], l[2])}
+        elif action in ("connect_objects", "disconnect_objects"):
+            line = (
+                cmd["src_varname"],
+                cmd.get("outlet_idx", 0),
+                cmd["dst_varname"],
+                cmd.get("inlet_idx", 0),
+            )
+            if action == "disconnect_objects":
+                self.lines.discard(line)
+            elif line[0] in self.boxes and line[2] in self.boxes:
+                self.lines.add(line)
+            # else Max rejects it unless it has boxes the mirror lacks; either
+            # way it stays unconfirmed until the next full snapshot
+        elif action == "set_object_attribute":
+            self.attributes.pop(varname, None)
+            if varname not in self.boxes or cmd["attr_name"] != "patching_rect":
+                return False
+            x, y, width, height = cmd["attr_value"]
+            self._move_box(varname, [x, y, x + width, y + height])
+        elif action == "move_objects":
+            for varname, (x, y) in cmd["positions"].items():
+                if varname in self.boxes:
+                    left, top, right, bottom = self.boxes[varname]["patching_rect"]
+                    self._move_box(varname, [x, y, x + right - left, y + bottom - top])
+        elif action in ("send_message_to_object", "set_message_text"):
+            # messages may change attributes or the text of the box
+            self.attributes.pop(varname, None)
+            return False
+        elif action == "send_messages":
+            for message in cmd["messages"]:
+                self.attributes.pop(message.get("varname"), None)
+            return False
+        else:
+            return False
+        self.version += 1
+        return True
+
+
 class MaxMSPConnection:
-    def __init__(self, server_url: str, server_port: int, namespace: str = NAMESPACE):
+    def __init__(
+        self,
+        server_url: str,
+        server_port: int,
+        namespace: str = NAMESPACE,
+        ack: bool = ACK_COMMANDS,
+        window: int = COMMAND_WINDOW,
+    ):
 
         self.server_url = server_url
         self.server_port = server_port
         self.namespace = namespace
+        self.ack = ack
+
+        self.rtt = None  # smoothed round trip time of requests, in seconds
+        self.failures = 0  # consecutive requests that timed out
 
-        self.sio = socketio.AsyncClient()
+        # reconnection is supervised by _reconnect_loop rather than by socketio
+        self.sio = socketio.AsyncClient(reconnection=False)
         self._pending = {}  # fetch requests that are not yet completed
+        # request_id -> [deadline, timeout, on_progress] of pending requests
+        self._deadlines = {}
+        self.latency = defaultdict(LatencyTracker)  # by action
+        self.metrics = Metrics()  # by action
+        self._response_sizes = {}  # request_id -> bytes of its packed response
+        # order of the messages to Max
+        self.scheduler = Scheduler(window, LANE_WEIGHTS, {"bulk": BULK_IN_FLIGHT})
+        self._connected = asyncio.Event()
+        self._replay = deque()  # commands issued while disconnected
+        self._reconnect_task = None
+        self._closing = False
+        self._inflight = {}  # coalesced requests being fetched, by key
+        self._recent = {}  # key -> (time, results) of finished coalesced requests
+        self.mirror = PatchMirror()
+        self._reconcile_task = None
+        # number boxes driven at a high rate, latest value wins
+        self.parameters = ParameterStream(
+            lambda cmd: self.send_command(cmd, ack=False), self._connected, STREAM_RATE
+        )
+
+        @self.sio.on("connect", namespace=self.namespace)
+        async def _on_connect():
+            self._connected.set()
+            if self._replay:
+                asyncio.create_task(self._drain_replay())
+
+        @self.sio.on("disconnect", namespace=self.namespace)
+        async def _on_disconnect(*args):
+            self._connected.clear()
+            self.mirror.invalidate()  # Max may come back with another patch
+            # fail pending requests now instead of letting them time out
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError("Connection to MaxMSP lost."))
+            self._supervise()
 
         @self.sio.on("response", namespace=self.namespace)
         async def _on_response(data):
-            req_id = data.get("request_id")
-            fut = self._pending.get(req_id)
-            if fut and not fut.done():
-                fut.set_result(data.get("results"))
-
-    async def send_command(self, cmd: dict):
-        """Send a command to MaxMSP."""
-        await self.sio.emit("command", cmd, namespace=self.namespace)
-        logging.info(f"Sent to MaxMSP: {cmd}")
-
-    async def send_request(self, payload: dict, timeout=2.0):
-        """Send a fetch request to MaxMSP."""
+            self._resolve(data)
+
+        @self.sio.on("progress", namespace=self.namespace)
+        async def _on_progress(data):
+            # Max is still working on a long request: push its deadline back
+            entry = self._deadlines.get(data.get("request_id"))
+            if entry is None:
+                return
+            entry[0] = asyncio.get_event_loop().time() + entry[1]
+            # the v8 add-on sends keep-alives with a stage name rather than a count
+            if entry[2] is not None and isinstance(data.get("progress"), (int, float)):
+                result = entry[2](data.get("progress"))
+                if inspect.isawaitable(result):
+                    await result
+
+        @self.sio.on("packed_response", namespace=self.namespace)
+        async def _on_packed_response(data):
+            self._resolve(unpack_response(data), len(data))
+
+    @property
+    def _auth(self) -> dict:
+        """Encodings offered to Max in the connection handshake."""
+        if msgpack is None:
+            return {"encodings": ["json"]}
+        return {"encodings": ["msgpack", "zlib", "json"]}
+
+    def _resolve(self, data: dict, size: int = 0):
+        req_id = data.get("request_id")
+        fut = self._pending.get(req_id)
+        if fut and not fut.done():
+            if size:
+                self._response_sizes[req_id] = size
+            fut.set_result(data.get("results"))
+
+    async def send_command(self, cmd: dict, ack: bool = None, timeout=None):
+        """Send a command to MaxMSP.
+
+        Without ack the command is fire-and-forget and None is returned. With ack,
+        Max reports back and a dict with "success", "error" and "elapsed_ms"
+        (Max-side execution time) is returned; timeouts and lost connections are
+        reported the same way, with "success" false.
+        """
+        if ack is None:
+            ack = self.ack
+        self._recent.clear()  # the patch may change, cached reads are stale
+        changed = self.mirror.apply_command(cmd)
+        if not ack:
+            size = len(json.dumps(cmd))
+            metrics = self.metrics[cmd.get("action")]
+            metrics.calls += 1
+            metrics.bytes_out += size
+            # keep the order of commands issued while disconnected
+            if not self._connected.is_set() or self._replay:
+                self._buffer(cmd)
+                return None
+            async with self.scheduler.turn(message_lane(cmd), size, message_keys(cmd)):
+                try:
+                    await self.sio.emit("command", cmd, namespace=self.namespace)
+                except socketio.exceptions.SocketIOError:
+                    self._buffer(cmd)
+                    return None
+            log_message("Sent to MaxMSP", cmd)
+            return None
+
+        try:
+            status = await self._send_and_wait("command", cmd, timeout)
+        except TimeoutError as e:
+            status = {"success": False, "error": str(e)}
+        except ConnectionError as e:
+            # already counted as an error by _send_and_wait
+            self.mirror.invalidate()
+            return {"success": False, "error": str(e)}
+        if not status.get("success"):
+            self.metrics[cmd.get("action")].errors += 1
+            self.mirror.invalidate()
+        elif changed:
+            self.mirror.confirm()
+        return status
+
+    async def send_or_buffer(self, cmd: dict) -> dict:
+        """Send an acknowledged command, or while Max is not connected buffer it
+        like a fire-and-forget one, to be sent on reconnection."""
+        if not self._connected.is_set():
+            await self.send_command(cmd, ack=False)
+            return {"success": True, "buffered": True}
+        return await self.send_command(cmd, ack=True)
+
+    async def send_commands(self, cmds: list, timeout=None) -> list:
+        """Send acknowledged commands in order, keeping up to `window` of them
+        in flight at once, and return one status per command."""
+        return await asyncio.gather(
+            *(self.send_command(cmd, ack=True, timeout=timeout) for cmd in cmds)
+        )
+
+    async def send_request(
+        self,
+        payload: dict,
+        timeout: float = None,
+        fresh_for: float = None,
+        on_progress: Callable = None,
+    ):
+        """Send a fetch request to MaxMSP.
+
+        Without a timeout, one is derived from the round trips measured for the
+        action and the size of the patch. Progress frames sent by Max during long
+        requests push the deadline back and are passed to `on_progress`.
+
+        Identical read-only requests issued while one is in flight share its
+        response. A response up to `fresh_for` seconds old (COALESCE_TTL by
+        default) is reused without asking Max again.
+        """
+        if payload.get("action") not in COALESCED_ACTIONS:
+            self._recent.clear()
+            changed = self.mirror.apply_command(payload)
+            try:
+                results = await self._send_and_wait(
+                    "request", payload, timeout, on_progress
+                )
+            except (TimeoutError, ConnectionError):
+                self.mirror.invalidate()  # Max may or may not have applied it
+                raise
+            if isinstance(results, list) and any(
+                isinstance(r, dict) and r.get("success") is False for r in results
+            ):
+                self.metrics[payload.get("action")].errors += 1
+                self.mirror.invalidate()
+            elif changed:
+                self.mirror.confirm()
+            return results
+
+        ttl = COALESCE_TTL if fresh_for is None else fresh_for
+        key = json.dumps(
+            {k: v for k, v in payload.items() if k != "request_id"}, sort_keys=True
+        )
+        cached = self._recent.get(key)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                self._send_and_wait("request", payload, timeout, on_progress)
+            )
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish_coalesced(key, f, ttl))
+        # a cancelled caller must not cancel the request shared with the others
+        return await asyncio.shield(future)
+
+    async def get_patch(
+        self, consistency: str = "eventual", on_progress: Callable = None
+    ) -> dict:
+        """Boxes and patch cords of the patch, served from the mirror unless
+        consistency is "strong", the mirror has not been synced yet or it has
+        changes that Max did not confirm."""
+        mirror = self.mirror
+        if consistency == "strong" or not mirror.synced or mirror.unconfirmed:
+            snapshot = await self.send_request(
+                {"action": "get_objects_in_patch"}, on_progress=on_progress
+            )
+            mirror.load_snapshot(snapshot)
+        return mirror.snapshot()
+
+    async def get_patch_page(
+        self, cursor: str = None, limit: int = None, on_progress: Callable = None
+    ) -> dict:
+        """One page of boxes (and the patch cords going out of them) of a snapshot
+        taken by the first page; pass the returned next_cursor for the next one."""
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be 1 or more.")
+        payload = {"action": "get_objects_in_patch", "cursor": cursor, "limit": limit}
+        page = await self.send_request(payload, on_progress=on_progress)
+        if page.get("expired"):
+            raise ValueError(page["error"])
+        if cursor is None and page["next_cursor"] is None:
+            self.mirror.load_snapshot(page)  # the whole patch fit in one page
+        return page
+
+    async def get_patch_changes(self, since_version: int) -> dict:
+        """Changes logged by max_mcp.js after since_version, or the full patch
+        (with "full": true) when the log no longer reaches back that far."""
+        payload = {"action": "get_patch_changes", "since_version": since_version}
+        delta = await self.send_request(payload)
+        self.mirror.apply_changes(since_version, delta)
+        return delta
+
+    async def get_avoid_rect(self, consistency: str = "eventual") -> list:
+        if consistency == "strong" or self.mirror.avoid_rect is None:
+            payload = {"action": "get_avoid_rect_position"}
+            self.mirror.avoid_rect = await self.send_request(payload)
+        return self.mirror.avoid_rect
+
+    async def find_free_position(
+        self, size: list, near: str = None, margin: float = 10
+    ) -> list:
+        """Top-left [x, y] of the closest position, below `near` when given, where
+        a box of the given [width, height] overlaps neither the boxes of the patch
+        nor the area of the agent's own objects."""
+        await self.get_patch()  # make sure the mirror has been synced
+        avoid = await self.get_avoid_rect()
+        avoid_key = ("avoid_rect",)
+        if avoid and None not in avoid:
+            self.mirror.grid.insert(avoid_key, avoid)
+        try:
+            if near is not None:
+                if near not in self.mirror.boxes:
+                    raise ValueError(f"Object not found: {near}")
+                left, top, right, bottom = self.mirror.boxes[near]["patching_rect"]
+                anchor = (left, bottom + margin)
+            else:
+                anchor = (margin, margin)
+            return self.mirror.grid.find_free(size, anchor, margin)
+        finally:
+            self.mirror.grid.remove(avoid_key)
+
+    async def layout_patch(
+        self, varnames: list = None, origin: list = None, h_gap: float = 20, v_gap: float = 40
+    ) -> dict:
+        """Arrange the boxes of the patcher (all of them, or the given ones) in rows
+        following the patch cords, then move them all in Max with a single
+        move_objects command. Boxes inside subpatchers are left alone."""
+        await self.get_patch()  # make sure the mirror has been synced
+        boxes, lines = self.mirror.top_level()
+        if varnames is None:
+            varnames = list(boxes)
+        missing = [v for v in varnames if v not in boxes]
+        if missing:
+            raise ValueError(f"Objects not found: {', '.join(missing)}")
+        rects = {v: boxes[v]["patching_rect"] for v in varnames}
+        if not rects:
+            return {"success": True, "moved": 0}
+        if origin is None:
+            # stay where the boxes were
+            origin = [min(r[0] for r in rects.values()), min(r[1] for r in rects.values())]
+        # off the event loop, which keeps serving realtime messages meanwhile
+        positions = await asyncio.to_thread(
+            layered_layout, rects, lines, origin, h_gap, v_gap
+        )
+        result = await self.send_command(
+            {"action": "move_objects", "positions": positions}, ack=True
+        )
+        return {**result, "moved": len(positions)}
+
+    def check_connection(self, cmd: dict, new_boxes: dict = None) -> str:
+        """Why a connect_objects command would fail, judged locally from the mirror
+        (and boxes about to be added), or None if it looks fine or cannot be judged."""
+        boxes = []
+        for varname in (cmd["src_varname"], cmd["dst_varname"]):
+            box = (new_boxes or {}).get(varname) or self.mirror.boxes.get(varname)
+            if box is None:
+                return f"Object not found: {varname}" if self.mirror.synced else None
+            boxes.append(box)
+        return connection_error(
+            boxes[0], cmd.get("outlet_idx", 0), boxes[1], cmd.get("inlet_idx", 0)
+        )
+
+    async def check_connections(
+        self, cmds: list, new_boxes: dict = None, refresh: bool = True
+    ) -> dict:
+        """Errors of the connect_objects commands that would fail, by index."""
+        errors = {}
+        for i, cmd in enumerate(cmds):
+            if cmd["action"] == "connect_objects":
+                error = self.check_connection(cmd, new_boxes)
+                if error:
+                    errors[i] = error
+        missing = any(e.startswith("Object not found") for e in errors.values())
+        if missing and refresh and self.mirror.max_version is not None:
+            # the patch may have been edited in Max since the mirror was synced
+            await self.get_patch_changes(self.mirror.max_version)
+            return await self.check_connections(cmds, new_boxes, refresh=False)
+        return errors
+
+    async def connect_objects(self, cmd: dict, check: bool = True):
+        """Send a connect_objects command, unless it is known to fail. check=False
+        sends it without checking."""
+        errors = await self.check_connections([cmd]) if check else None
+        if errors:
+            return {"success": False, "error": errors[0]}
+        return await self.send_command(cmd)
+
+    async def apply_batch(self, operations: list, check: bool = True):
+        """Send operations as one apply_batch request, unless one of its connections
+        is known to fail, in which case nothing is sent. check=False skips the
+        checks, for operations checked beforehand."""
+        errors = None
+        if check:
+            errors = await self.check_connections(operations, batch_boxes(operations))
+        if errors:
+            return [
+                {
+                    "index": i,
+                    "action": op["action"],
+                    "success": False,
+                    "error": errors.get(i, "Not sent: the batch has invalid connections."),
+                }
+                for i, op in enumerate(operations)
+            ]
+        if len(operations) <= BATCH_CHUNK_SIZE:
+            return await self.send_request({"action": "apply_batch", "operations": operations})
+        # in chunks, which the scheduler lets through in order, BULK_IN_FLIGHT at a
+        # time, so that parameter changes do not wait for the whole batch
+        starts = range(0, len(operations), BATCH_CHUNK_SIZE)
+        responses = await asyncio.gather(
+            *(
+                self.send_request(
+                    {"action": "apply_batch", "operations": operations[start : start + BATCH_CHUNK_SIZE]}
+                )
+                for start in starts
+            ),
+            return_exceptions=True,
+        )
+        results = []
+        for start, response in zip(starts, responses):
+            if isinstance(response, (TimeoutError, ConnectionError)):
+                # the other chunks may have been applied: report them all the same
+                chunk = operations[start : start + BATCH_CHUNK_SIZE]
+                response = [
+                    {"index": i, "action": op["action"], "success": False, "error": str(response)}
+                    for i, op in enumerate(chunk)
+                ]
+            elif isinstance(response, BaseException):
+                raise response
+            elif not isinstance(response, list):
+                return response
+            for result in response:
+                result["index"] += start
+            results += response
+        return results
+
+    async def apply_patch_state(
+        self,
+        objects: list,
+        connections: list = (),
+        attributes: list = (),
+        prune: bool = True,
+        dry_run: bool = False,
+    ) -> dict:
+        """Turn the patch into the described one with the fewest commands (see
+        patch_diff.diff_patch), sent as one apply_batch request. Boxes inside
+        subpatchers are neither compared nor pruned."""
+        # a full snapshot, as the change log misses boxes retyped in Max: their
+        # text is only read when the whole patch is
+        await self.get_patch("strong")
+        boxes, lines = self.mirror.top_level()
+        operations = diff_patch(
+            boxes,
+            lines,
+            self.mirror.attributes,
+            objects,
+            connections,
+            attributes,
+            prune,
+        )
+        if dry_run:
+            return {"success": True, "sent": False, "operations": operations}
+        counts = {}
+        for op in operations:
+            counts[op["action"]] = counts.get(op["action"], 0) + 1
+        results = await self.apply_batch(operations) if operations else []
+        failed = [r for r in results if not r.get("success")] if isinstance(results, list) else []
+        return {
+            "success": isinstance(results, list) and not failed,
+            "sent": bool(operations),
+            "operations": counts,
+            "errors": failed if isinstance(results, list) else results,
+        }
+
+    async def instantiate_template(
+        self, template: Template, prefix: str, origin: list, params: dict = None
+    ) -> dict:
+        """Add a template at origin as one apply_batch request. Its patch cords were
+        checked when it was prepared, so only varnames already taken are checked."""
+        operations, varnames = template.instantiate(prefix, origin, params)
+        taken = [v for v in varnames.values() if v in self.mirror.boxes]
+        if taken:
+            raise ValueError(f"Varnames already in the patch: {', '.join(taken)}")
+        results = await self.apply_batch(operations, check=False)
+        failed = [r for r in results if not r.get("success")] if isinstance(results, list) else []
+        return {
+            "success": isinstance(results, list) and not failed,
+            "varnames": varnames,
+            "errors": failed if isinstance(results, list) else results,
+        }
+
+    async def get_attributes(self, varname: str, consistency: str = "eventual"):
+        attributes = self.mirror.attributes.get(varname)
+        if consistency == "strong" or attributes is None:
+            payload = {"action": "get_object_attributes", "varname": varname}
+            attributes = await self.send_request(payload)
+            self.mirror.attributes[varname] = attributes
+        return attributes
+
+    async def _reconcile_loop(self):
+        while not self._closing:
+            await asyncio.sleep(MIRROR_RECONCILE_INTERVAL)
+            if self.connected:
+                try:
+                    await self.get_patch(consistency="strong")
+                except (TimeoutError, ConnectionError) as e:
+                    logging.warning(f"Could not reconcile patch mirror: {e}")
+
+    def _finish_coalesced(self, key: str, future: asyncio.Future, ttl: float):
+        self._inflight.pop(key, None)
+        if ttl > 0 and not future.cancelled() and future.exception() is None:
+            self._recent[key] = (time.monotonic(), future.result())
+
+    async def stream_parameters(self, values: dict, rate: float = None) -> dict:
+        """Queue the latest values of number boxes for the parameter stream."""
+        if rate is not None:
+            self.parameters.rate = rate
+        self.parameters.update(values)
+        return self.parameters.stats()
+
+    async def latency_stats(self) -> dict:
+        stats = {}
+        for action, tracker in self.latency.items():
+            latency = self.metrics[action].latency.snapshot()
+            latency.pop("buckets", None)
+            latency.pop("mean_ms", None)
+            stats[action] = {**latency, "timeout_s": round(tracker.timeout(), 3)}
+        return stats
+
+    async def metrics_snapshot(self) -> dict:
+        """Health of the connection and counters of the messages to Max, by action."""
+        return {
+            "connected": self.connected,
+            "rtt_ms": None if self.rtt is None else round(self.rtt * 1000, 3),
+            "failures": self.failures,
+            "in_flight": self.scheduler.in_flight,
+            "waiting": self.scheduler.waiting(),
+            "parameter_stream": self.parameters.stats(),
+            "actions": self.metrics.snapshot(),
+        }
+
+    def _size_factor(self, payload: dict) -> float:
+        """How much bigger than a minimal request this one is expected to be."""
+        if payload.get("action") == "apply_batch":
+            return 1 + len(payload["operations"]) / 100
+        if payload.get("action") == "move_objects":
+            return 1 + len(payload["positions"]) / 1000
+        if payload.get("limit"):
+            return 1 + payload["limit"] / 1000
+        if payload.get("action") in SIZED_ACTIONS:
+            return 1 + len(self.mirror.boxes) / 1000
+        return 1.0
+
+    async def _send_and_wait(
+        self, event: str, payload: dict, timeout, on_progress: Callable = None
+    ):
+        tracker = self.latency[payload.get("action")]
+        metrics = self.metrics[payload.get("action")]
+        metrics.calls += 1
+        size_factor = self._size_factor(payload)
+        if timeout is None:
+            timeout = tracker.timeout(size_factor)
+        if not self._connected.is_set():
+            try:
+                await asyncio.wait_for(self._connected.wait(), timeout)
+            except asyncio.TimeoutError:
+                metrics.errors += 1
+                raise ConnectionError("Not connected to MaxMSP.")
+
         request_id = str(uuid.uuid4())
+        # copy, so that the same payload can be sent to several instances at once
+        payload = dict(payload, request_id=request_id)
+        size = len(json.dumps(payload))
+        metrics.bytes_out += size
+        # the deadline starts when the scheduler lets the request through
+        async with self.scheduler.turn(message_lane(payload), size, message_keys(payload)):
+            return await self._emit_and_wait(
+                event, payload, timeout, size_factor, on_progress
+            )
+
+    async def _emit_and_wait(
+        self, event: str, payload: dict, timeout: float, size_factor: float, on_progress
+    ):
+        tracker = self.latency[payload.get("action")]
+        metrics = self.metrics[payload.get("action")]
+        request_id = payload["request_id"]
         future = asyncio.get_event_loop().create_future()
         self._pending[request_id] = future
-
-        payload.update({"request_id": request_id})
-        await self.sio.emit("request", payload, namespace=self.namespace)
-        logging.info(f"Request to MaxMSP: {payload}")
+        loop = asyncio.get_event_loop()
+        deadline = [loop.time() + timeout, timeout, on_progress]
+        self._deadlines[request_id] = deadline
+        start = time.perf_counter()
 
         try:
-            response = await asyncio.wait_for(future, timeout)
+            try:
+                await self.sio.emit(event, payload, namespace=self.namespace)
+            except socketio.exceptions.SocketIOError as e:
+                # the connection dropped since _send_and_wait checked it
+                metrics.errors += 1
+                raise ConnectionError(f"Not connected to MaxMSP: {e}") from e
+            log_message("Request to MaxMSP", payload)
+            while not future.done():
+                remaining = deadline[0] - loop.time()
+                if remaining <= 0:
+                    self.failures += 1
+                    metrics.timeouts += 1
+                    raise TimeoutError(
+                        f"No response received in {timeout:.2f} seconds."
+                    )
+                await asyncio.wait({future}, timeout=remaining)
+            try:
+                response = future.result()
+            except ConnectionError:
+                metrics.errors += 1
+                raise
+            elapsed = time.perf_counter() - start
+            tracker.record(elapsed, size_factor)
+            metrics.latency.record(elapsed)
+            metrics.bytes_in += self._response_sizes.pop(request_id, 0)
+            self._record_round_trip(elapsed)
             return response
-        except asyncio.TimeoutError:
-            raise TimeoutError(f"No response received in {timeout} seconds.")
         finally:
             self._pending.pop(request_id, None)
+            self._deadlines.pop(request_id, None)
+            self._response_sizes.pop(request_id, None)
+
+    def _record_round_trip(self, elapsed: float):
+        self.failures = 0
+        if self.rtt is None:
+            self.rtt = elapsed
+        else:
+            self.rtt = 0.8 * self.rtt + 0.2 * elapsed
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    @property
+    def health_score(self) -> float:
+        """Lower is better: the smoothed round trip time in seconds, plus one second
+        per consecutive timeout. Endpoints that have not answered yet score 0 so
+        they get tried."""
+        if not self.connected:
+            return float("inf")
+        return (self.rtt or 0.0) + self.failures
+
+    def _buffer(self, cmd: dict):
+        if len(self._replay) >= REPLAY_BUFFER_SIZE:
+            dropped = self._replay.popleft()
+            logging.warning(f"Replay buffer full, dropping: {dropped}")
+            self.mirror.invalidate()  # the mirror has the dropped command's effect
+        self._replay.append(cmd)
+
+    async def _drain_replay(self):
+        """Send the commands buffered while disconnected, in order."""
+        while self._replay and self._connected.is_set():
+            cmd = self._replay.popleft()
+            try:
+                await self.sio.emit("command", cmd, namespace=self.namespace)
+            except socketio.exceptions.SocketIOError:
+                self._replay.appendleft(cmd)
+                return
+            log_message("Replayed to MaxMSP", cmd)
+
+    def _supervise(self):
+        if self._closing:
+            return
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        """Reconnect with exponential backoff and full jitter."""
+        full_url = f"{self.server_url}:{self.server_port}"
+        delay = RECONNECT_DELAY
+        while not self._closing and not self.sio.connected:
+            await asyncio.sleep(random.uniform(0, delay))
+            try:
+                await self.sio.connect(
+                    full_url, namespaces=self.namespace, auth=self._auth
+                )
+                logging.info(f"Reconnected to Socket.IO server at {full_url}")
+            except (socketio.exceptions.ConnectionError, OSError):
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
 
     async def start_server(self) -> None:
         """IMPORTANT: This method should only be called ONCE per application instance.
         Multiple calls can lead to binding multiple ports unnecessarily.
+
+        If Max is not reachable yet, keeps trying in the background.
         """
+        if MIRROR_RECONCILE_INTERVAL > 0 and self._reconcile_task is None:
+            self._reconcile_task = asyncio.create_task(self._reconcile_loop())
         try:
             # Connect to the server
             full_url = f"{self.server_url}:{self.server_port}"
-            await self.sio.connect(full_url, namespaces=self.namespace)
+            await self.sio.connect(full_url, namespaces=self.namespace, auth=self._auth)
             logging.info(f"Connected to Socket.IO server at {full_url}")
             return
 
-        except OSError as e:
+        except (socketio.exceptions.ConnectionError, OSError) as e:
             logging.error(f"Error starting Socket.IO server: {e}")
+            self._supervise()
+
+    async def close(self) -> None:
+        """Disconnect and stop reconnecting."""
+        self._closing = True
+        for task in (self._reconnect_task, self._reconcile_task):
+            if task is not None:
+                task.cancel()
+        self.parameters.close()
+        await self.sio.disconnect()
+
+
+class MaxMSPRegistry:
+    """Named Max instances, each with its own connection."""
+
+    def __init__(self, endpoints: dict, namespace: str = NAMESPACE):
+        self.connections = {
+            name: MaxMSPConnection(url, port, namespace)
+            for name, (url, port) in endpoints.items()
+        }
+        self.default = next(iter(self.connections))
+
+    @classmethod
+    def from_env(cls) -> "MaxMSPRegistry":
+        endpoints = {}
+        for entry in filter(None, MAXMSP_ENDPOINTS.split(",")):
+            name, address = entry.strip().split("=", 1)
+            url, port = address.rsplit(":", 1)
+            endpoints[name] = (url, port)
+        if not endpoints:
+            endpoints["default"] = (SOCKETIO_SERVER_URL, SOCKETIO_SERVER_PORT)
+        return cls(endpoints)
+
+    def get(self, target: str = None) -> MaxMSPConnection:
+        """Return the connection for a target name, the default one when target
+        is None, or the healthiest one for FASTEST_TARGET."""
+        if target is None:
+            return self.connections[self.default]
+        if target == FASTEST_TARGET:
+            return min(self.connections.values(), key=lambda c: c.health_score)
+        try:
+            return self.connections[target]
+        except KeyError:
+            raise ValueError(
+                f"Unknown target: {target}. Available: {list(self.connections)}"
+            )
+
+    async def broadcast(self, method: str, *args, **kwargs) -> dict:
+        """Call a MaxMSPConnection method on every instance concurrently."""
+        names = list(self.connections)
+        results = await asyncio.gather(
+            *(
+                getattr(self.connections[name], method)(*args, **kwargs)
+                for name in names
+            ),
+            return_exceptions=True,
+        )
+        return {
+            name: {"error": str(r)} if isinstance(r, Exception) else r
+            for name, r in zip(names, results)
+        }
+
+    async def start(self):
+        await asyncio.gather(*(c.start_server() for c in self.connections.values()))
+
+    async def stop(self):
+        await asyncio.gather(*(c.close() for c in self.connections.values()))
 
 
 @asynccontextmanager
@@ -86,34 +1198,81 @@ async def server_lifespan(server: FastMCP):
     """Manage server lifespan"""
     global io_server_started
     if not io_server_started:
+        registry = MaxMSPRegistry.from_env()
         try:
-            maxmsp = MaxMSPConnection(
-                SOCKETIO_SERVER_URL, SOCKETIO_SERVER_PORT, NAMESPACE
-            )
             try:
-                # Start the Socket.IO server
-                await maxmsp.start_server()
+                # Build or open the docs index now rather than on the first lookup
+                await asyncio.to_thread(docs_index.names)
+                await asyncio.to_thread(template_registry.names)
+                # Connect to every Max instance
+                await registry.start()
                 io_server_started = True
-                logging.info(f"Listening on {maxmsp.server_url}:{maxmsp.server_port}")
+                for name, maxmsp in registry.connections.items():
+                    logging.info(
+                        f"Listening on {maxmsp.server_url}:{maxmsp.server_port} ({name})"
+                    )
 
-                # Yield the Socket.IO connection to make it available in the lifespan context
-                yield {"maxmsp": maxmsp}
+                # Yield the connections to make them available in the lifespan context
+                yield {"maxmsp": registry.get(), "registry": registry}
             except Exception as e:
                 logging.error(f"lifespan error starting server: {e}")
-                await maxmsp.sio.disconnect()
                 raise
 
         finally:
             logging.info("Shutting down connection")
-            await maxmsp.sio.disconnect()
+            await registry.stop()
     else:
-        logging.info(
-            f"IO server already running on {maxmsp.server_url}:{maxmsp.server_port}"
-        )
+        logging.info("IO server already running")
+
+
+def get_registry(ctx: Context) -> MaxMSPRegistry:
+    return ctx.request_context.lifespan_context.get("registry")
+
+
+async def call_target(ctx: Context, target: str, method: str, *args, **kwargs):
+    """Call a MaxMSPConnection method on one Max instance, or on all of them
+    for BROADCAST_TARGET."""
+    registry = get_registry(ctx)
+    if target == BROADCAST_TARGET:
+        return await registry.broadcast(method, *args, **kwargs)
+    return await getattr(registry.get(target), method)(*args, **kwargs)
+
+
+async def send_command_to(ctx: Context, cmd: dict, target: str = None):
+    """Send a command to one Max instance, or to all of them for BROADCAST_TARGET."""
+    return await call_target(ctx, target, "send_command", cmd)
+
+
+async def send_request_to(ctx: Context, payload: dict, target: str = None, **kwargs):
+    """Send a request to one Max instance, or to all of them for BROADCAST_TARGET."""
+    return await call_target(ctx, target, "send_request", payload, **kwargs)
+
+
+class MeteredFastMCP(FastMCP):
+    """FastMCP recording the calls, errors, latency and response size of each tool."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tool_metrics = Metrics()
+
+    async def call_tool(self, name: str, arguments: dict):
+        metrics = self.tool_metrics[name]
+        metrics.calls += 1
+        metrics.bytes_in += len(json.dumps(arguments, default=str))
+        start = time.perf_counter()
+        try:
+            content = await super().call_tool(name, arguments)
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            metrics.latency.record(time.perf_counter() - start)
+        metrics.bytes_out += sum(len(getattr(c, "text", "")) for c in content)
+        return content
 
 
 # Create the MCP server with lifespan support
-mcp = FastMCP(
+mcp = MeteredFastMCP(
     "MaxMSPMCP",
     description="MaxMSP integration through the Model Context Protocol",
     lifespan=server_lifespan,
@@ -127,20 +1286,27 @@ async def add_max_object(
     obj_type: str,
     varname: str,
     args: list,
+    target: str = None,
 ):
     """Add a new Max object.
 
     The position is is a list of two integers representing the x and y coordinates,
     which should be outside the rectangular area returned by get_avoid_rect_position() function.
+    Use find_free_position() to get a position that does not overlap other objects.
+    An obj_type missing from the documentation gets a warning with the closest valid names.
 
     Args:
         position (list): Position in the Max patch as [x, y].
         obj_type (str): Type of the Max object (e.g., "cycle~", "dac~").
         varname (str): Variable name for the object.
         args (list): Arguments for the object.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
     assert len(position) == 2, "Position must be a list of two integers."
+    unknown = unknown_object_types([obj_type]).get(obj_type)
+    if unknown and REJECT_UNKNOWN_OBJECTS:
+        raise ValueError(unknown["message"])
     cmd = {"action": "add_object"}
     kwargs = {
         "position": position,
@@ -149,24 +1315,30 @@ async def add_max_object(
         "varname": varname,
     }
     cmd.update(kwargs)
-    await maxmsp.send_command(cmd)
+    response = await send_command_to(ctx, cmd, target)
+    if unknown:
+        # sent anyway: it may be an abstraction or an undocumented external
+        return {**(response or {}), "warning": unknown["error"], "suggestions": unknown["suggestions"]}
+    return response
 
 
 @mcp.tool()
 async def remove_max_object(
     ctx: Context,
     varname: str,
+    target: str = None,
 ):
     """Delete a Max object.
 
     Args:
         varname (str): Variable name for the object.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
     cmd = {"action": "remove_object"}
     kwargs = {"varname": varname}
     cmd.update(kwargs)
-    await maxmsp.send_command(cmd)
+    return await send_command_to(ctx, cmd, target)
 
 
 @mcp.tool()
@@ -176,16 +1348,24 @@ async def connect_max_objects(
     outlet_idx: int,
     dst_varname: str,
     inlet_idx: int,
+    check: bool = True,
+    target: str = None,
 ):
     """Connect two Max objects.
 
+    The connection is checked first against the documented inlets and outlets of
+    both objects; an impossible one is not sent and an error is returned.
+
     Args:
         src_varname (str): Variable name of the source object.
         outlet_idx (int): Outlet index on the source object.
         dst_varname (str): Variable name of the destination object.
         inlet_idx (int): Inlet index on the destination object.
+        check (bool, optional): Check the connection first. Pass False when the
+            check is wrong, e.g. for an abstraction shadowing a documented class.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
     cmd = {"action": "connect_objects"}
     kwargs = {
         "src_varname": src_varname,
@@ -194,7 +1374,7 @@ async def connect_max_objects(
         "inlet_idx": inlet_idx,
     }
     cmd.update(kwargs)
-    await maxmsp.send_command(cmd)
+    return await call_target(ctx, target, "connect_objects", cmd, check)
 
 
 @mcp.tool()
@@ -204,6 +1384,7 @@ async def disconnect_max_objects(
     outlet_idx: int,
     dst_varname: str,
     inlet_idx: int,
+    target: str = None,
 ):
     """Disconnect two Max objects.
 
@@ -212,8 +1393,9 @@ async def disconnect_max_objects(
         outlet_idx (int): Outlet index on the source object.
         dst_varname (str): Variable name of the destination object.
         inlet_idx (int): Inlet index on the destination object.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
     cmd = {"action": "disconnect_objects"}
     kwargs = {
         "src_varname": src_varname,
@@ -222,7 +1404,7 @@ async def disconnect_max_objects(
         "inlet_idx": inlet_idx,
     }
     cmd.update(kwargs)
-    await maxmsp.send_command(cmd)
+    return await send_command_to(ctx, cmd, target)
 
 
 @mcp.tool()
@@ -231,6 +1413,7 @@ async def set_object_attribute(
     varname: str,
     attr_name: str,
     attr_value: list,
+    target: str = None,
 ):
     """Set an attribute of a Max object.
 
@@ -238,12 +1421,13 @@ async def set_object_attribute(
         varname (str): Variable name of the object.
         attr_name (str): Name of the attribute to be set.
         attr_value (list): Values of the attribute to be set.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
     cmd = {"action": "set_object_attribute"}
     kwargs = {"varname": varname, "attr_name": attr_name, "attr_value": attr_value}
     cmd.update(kwargs)
-    await maxmsp.send_command(cmd)
+    return await send_command_to(ctx, cmd, target)
 
 
 @mcp.tool()
@@ -251,32 +1435,39 @@ async def set_message_text(
     ctx: Context,
     varname: str,
     text_list: list,
+    target: str = None,
 ):
     """Set the text of a message object in MaxMSP.
 
     Args:
         varname (str): Variable name of the message object.
         text_list (list): A list of arguments to be set to the message object.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
     cmd = {"action": "set_message_text"}
     kwargs = {"varname": varname, "new_text": text_list}
     cmd.update(kwargs)
-    await maxmsp.send_command(cmd)
+    return await send_command_to(ctx, cmd, target)
 
 
 @mcp.tool()
-async def send_bang_to_object(ctx: Context, varname: str):
+async def send_bang_to_object(
+    ctx: Context,
+    varname: str,
+    target: str = None,
+):
     """Send a bang to an object in MaxMSP.
 
     Args:
         varname (str): Variable name of the object to be banged.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
     cmd = {"action": "send_bang_to_object"}
     kwargs = {"varname": varname}
     cmd.update(kwargs)
-    await maxmsp.send_command(cmd)
+    return await send_command_to(ctx, cmd, target)
 
 
 @mcp.tool()
@@ -284,6 +1475,7 @@ async def send_messages_to_object(
     ctx: Context,
     varname: str,
     message: list,
+    target: str = None,
 ):
     """Send a message to an object in MaxMSP. The message is made of a list of arguments.
 
@@ -297,12 +1489,13 @@ async def send_messages_to_object(
     Args:
         varname (str): Variable name of the object to be messaged.
         message (list): A list of messages to be sent to the object.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
     cmd = {"action": "send_message_to_object"}
     kwargs = {"varname": varname, "message": message}
     cmd.update(kwargs)
-    await maxmsp.send_command(cmd)
+    return await send_command_to(ctx, cmd, target)
 
 
 @mcp.tool()
@@ -310,6 +1503,7 @@ async def set_number(
     ctx: Context,
     varname: str,
     num: float,
+    target: str = None,
 ):
     """Set the value of a object in MaxMSP.
     The object can be a number box, a slider, a dial, a gain.
@@ -317,47 +1511,541 @@ async def set_number(
     Args:
         varname (str): Variable name of the comment object.
         num (float): Value to be set for the object.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
     """
 
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
     cmd = {"action": "set_number"}
     kwargs = {"varname": varname, "num": num}
     cmd.update(kwargs)
-    await maxmsp.send_command(cmd)
+    return await send_command_to(ctx, cmd, target)
+
+
+@mcp.tool()
+async def set_numbers(
+    ctx: Context,
+    values: dict,
+    target: str = None,
+):
+    """Set the values of many number boxes, sliders, dials or gains at once, e.g. to
+    recall a preset. Prefer this over several set_number calls: all the values are
+    sent in one message and set by Max in one pass.
+
+    Args:
+        values (dict): Varname -> value, for every object to set.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        dict: success, and in "failed" the varname and error of each object that
+            could not be set. While Max is not connected, the values are kept and
+            set on reconnection, and "buffered" is true.
+    """
+    for varname, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Value of {varname} must be a number, not {value!r}.")
+    cmd = {"action": "set_numbers", "values": values}
+    return await call_target(ctx, target, "send_or_buffer", cmd)
+
+
+@mcp.tool()
+async def send_messages_bulk(
+    ctx: Context,
+    messages: list,
+    target: str = None,
+):
+    """Send messages to many objects at once. Prefer this over several
+    send_messages_to_object calls: all the messages are sent in one message to Max
+    and delivered in one pass, in order.
+
+    Example:
+        messages=[
+            {"varname": "filter", "message": ["cutoff", 1200]},
+            {"varname": "osc", "message": ["frequency", 220]},
+        ]
+
+    Args:
+        messages (list): Each has "varname" and "message", a list of arguments as for
+            send_messages_to_object.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        dict: success, and in "failed" the varname and error of each message that
+            could not be delivered. While Max is not connected, the messages are kept
+            and delivered on reconnection, and "buffered" is true.
+    """
+    for message in messages:
+        if not message.get("varname") or not message.get("message"):
+            raise ValueError(f"Each message needs a varname and a message: {message}")
+    cmd = {"action": "send_messages", "messages": messages}
+    return await call_target(ctx, target, "send_or_buffer", cmd)
+
+
+@mcp.tool()
+async def stream_parameters(
+    ctx: Context,
+    values: dict,
+    rate: float = None,
+    target: str = None,
+):
+    """Drive number boxes, sliders or dials continuously: ramps, LFOs, sensor data.
+
+    Prefer this over calling set_number in a loop. Values are not sent one by one:
+    only the latest value of each object is kept, and all the changed ones are sent
+    together, in one message applied by Max in one pass, at most `rate` times per
+    second. Returns immediately.
+
+    Args:
+        values (dict): Varname -> new value, for any number of objects.
+        rate (float, optional): Sends per second, from 1 to 1000; it applies to the
+            following calls too. Defaults to STREAM_RATE (200).
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        dict: Counters of the stream: updates received, messages sent, values sent,
+            updates replaced by a newer value before being sent, and pending values.
+    """
+    if rate is not None and not 1 <= rate <= 1000:
+        raise ValueError("Rate must be between 1 and 1000 per second.")
+    for varname, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Value of {varname} must be a number, not {value!r}.")
+    return await call_target(ctx, target, "stream_parameters", values, rate)
+
+
+def compile_subgraph(objects: list, connections: list, attributes: list) -> list:
+    """Translate a subgraph description into an ordered list of Max commands.
+
+    Local references ("ref") used by connections and attribute sets are resolved
+    to the varnames of the objects created in the same subgraph; any other name
+    is treated as the varname of an object already in the patch.
+    """
+    refs = {}
+    operations = []
+    for obj in objects:
+        varname = obj.get("varname") or obj.get("ref")
+        if not varname:
+            raise ValueError(f"Object needs a ref or a varname: {obj}")
+        if "obj_type" not in obj:
+            raise ValueError(f"Object {varname} is missing obj_type.")
+        position = obj.get("position", [0, 0])
+        if len(position) != 2:
+            raise ValueError(f"Position of {varname} must be a list of two integers.")
+        refs[obj.get("ref", varname)] = varname
+        operations.append(
+            {
+                "action": "add_object",
+                "position": position,
+                "obj_type": obj["obj_type"],
+                "args": obj.get("args", []),
+                "varname": varname,
+            }
+        )
+    for conn in connections:
+        operations.append(
+            {
+                "action": "connect_objects",
+                "src_varname": refs.get(conn["src"], conn["src"]),
+                "outlet_idx": conn.get("outlet_idx", 0),
+                "dst_varname": refs.get(conn["dst"], conn["dst"]),
+                "inlet_idx": conn.get("inlet_idx", 0),
+            }
+        )
+    for attr in attributes:
+        operations.append(
+            {
+                "action": "set_object_attribute",
+                "varname": refs.get(attr["target"], attr["target"]),
+                "attr_name": attr["attr_name"],
+                "attr_value": attr["attr_value"],
+            }
+        )
+    return operations
+
+
+@mcp.tool()
+async def build_subgraph(
+    ctx: Context,
+    objects: list,
+    connections: list = [],
+    attributes: list = [],
+    check: bool = True,
+    target: str = None,
+):
+    """Add objects, connect them and set their attributes in a single operation.
+
+    Prefer this over many add_max_object / connect_max_objects / set_object_attribute
+    calls when building more than a couple of objects. All operations are sent as one
+    message and run in order inside Max: objects first, then connections, then attributes.
+
+    Example:
+        objects=[
+            {"ref": "osc", "obj_type": "cycle~", "position": [100, 100], "args": [440]},
+            {"ref": "out", "obj_type": "dac~", "position": [100, 200], "args": []},
+        ]
+        connections=[
+            {"src": "osc", "outlet_idx": 0, "dst": "out", "inlet_idx": 0},
+            {"src": "osc", "outlet_idx": 0, "dst": "out", "inlet_idx": 1},
+        ]
+
+    Args:
+        objects (list): Objects to add. Each has "ref" (local reference, also used as
+            varname unless "varname" is given), "obj_type", "position" as [x, y] and "args".
+        connections (list): Patch cords to add. Each has "src", "outlet_idx", "dst" and
+            "inlet_idx", where "src" and "dst" are refs of new objects or varnames of
+            existing objects.
+        attributes (list): Attributes to set. Each has "target" (ref or varname),
+            "attr_name" and "attr_value".
+        check (bool, optional): Check the connections against the documented
+            inlets and outlets first, sending nothing if one is impossible. Pass
+            False when the check is wrong, e.g. for an abstraction shadowing a
+            documented class.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        list: One result per operation, with its action, success flag and error if any,
+            and a warning with the closest valid names for unknown object types.
+    """
+    operations = compile_subgraph(objects, connections, attributes)
+    obj_types = {i: op["obj_type"] for i, op in enumerate(operations) if op["action"] == "add_object"}
+    unknown = unknown_object_types(obj_types.values())
+    if unknown and REJECT_UNKNOWN_OBJECTS:
+        raise ValueError("; ".join(e["message"] for e in unknown.values()))
+    response = await call_target(ctx, target, "apply_batch", operations, check)
+    if isinstance(response, list):
+        for result in response:
+            unknown_type = unknown.get(obj_types.get(result.get("index")))
+            if unknown_type:
+                result["warning"] = unknown_type["error"]
+                result["suggestions"] = unknown_type["suggestions"]
+
+    return response
+
+
+@mcp.tool()
+async def apply_patch_state(
+    ctx: Context,
+    objects: list,
+    connections: list = [],
+    attributes: list = [],
+    prune: bool = True,
+    dry_run: bool = False,
+    target: str = None,
+):
+    """Make the patch match a description of the boxes and patch cords it should
+    have, sending only the differences with its current state in one operation.
+
+    Describe the whole desired patch as for build_subgraph; objects are identified
+    by their varname (or ref). Unchanged objects and cords cost nothing, so send the
+    full description again after editing it rather than individual commands:
+    - new objects are added, objects whose obj_type or args changed are re-created,
+    - objects whose position changed are moved,
+    - cords are added and removed to match connections,
+    - attributes are set when they differ from the value last read from Max.
+
+    Args:
+        objects (list): Every object of the patch. Each has "varname" (or "ref"),
+            "obj_type", "args" and optionally "position" as [x, y]; without a
+            position, existing objects stay where they are and new ones go to [0, 0].
+        connections (list): Every patch cord, each with "src", "outlet_idx", "dst" and
+            "inlet_idx".
+        attributes (list): Attributes to set. Each has "target", "attr_name" and
+            "attr_value".
+        prune (bool): Remove the objects and cords that are not described. With
+            False, they are left alone and may be used in connections. Objects
+            inside subpatchers are always left alone.
+        dry_run (bool): Only return the commands that would be sent.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        dict: success, the number of commands sent by action and the failed ones, or
+            the commands themselves with dry_run.
+    """
+    unknown = unknown_object_types(obj.get("obj_type") for obj in objects)
+    warnings = [e["message"] for e in unknown.values()]
+    if unknown and REJECT_UNKNOWN_OBJECTS:
+        raise ValueError("; ".join(warnings))
+    response = await call_target(
+        ctx, target, "apply_patch_state", objects, connections, attributes, prune, dry_run
+    )
+    if warnings and isinstance(response, dict) and "success" in response:
+        response["warnings"] = warnings
+    return response
+
+
+def prepare_template(template: Template):
+    """Compile a template and check its patch cords against the docs, once."""
+    operations = compile_subgraph(template.objects, template.connections, template.attributes)
+    boxes = batch_boxes(operations)
+    for op in operations:
+        if op["action"] != "connect_objects":
+            continue
+        src, dst = boxes.get(op["src_varname"]), boxes.get(op["dst_varname"])
+        error = src and dst and connection_error(src, op["outlet_idx"], dst, op["inlet_idx"])
+        if error:
+            raise ValueError(error)
+    unknown = unknown_object_types(
+        op["obj_type"] for op in operations if op["action"] == "add_object"
+    )
+    if unknown and REJECT_UNKNOWN_OBJECTS:
+        raise ValueError("; ".join(e["message"] for e in unknown.values()))
+    template.prepare(operations)
+    template.warnings = [e["message"] for e in unknown.values()]
+
+
+template_registry = TemplateRegistry(TEMPLATES_DIR, prepare_template)
+
+
+def parse_arg(word: str):
+    """A word of a box text as a number when it is one."""
+    for kind in (int, float):
+        try:
+            return kind(word)
+        except ValueError:
+            pass
+    return word
+
+
+def template_from_selection(selection: dict, name: str, description: str = "") -> Template:
+    """A template of the boxes and patch cords of a get_objects_in_selected result,
+    with the boxes' varnames as refs and positions relative to their top-left."""
+    boxes = [entry["box"] for entry in selection.get("boxes") or []]
+    if not boxes:
+        raise ValueError("Nothing is selected in the patch.")
+    left = min(box["patching_rect"][0] for box in boxes)
+    top = min(box["patching_rect"][1] for box in boxes)
+    objects = []
+    for box in boxes:
+        words = (box.get("text") or "").split()
+        if box.get("maxclass") == "newobj" and words:
+            obj_type, args = words[0], words[1:]
+        else:
+            obj_type, args = box.get("maxclass"), words
+        x, y = box["patching_rect"][:2]
+        objects.append(
+            {
+                "ref": box["varname"],
+                "obj_type": obj_type,
+                "position": [x - left, y - top],
+                "args": [parse_arg(word) for word in args],
+            }
+        )
+    refs = {box["varname"] for box in boxes}
+    connections = [
+        {"src": src, "outlet_idx": outlet_idx, "dst": dst, "inlet_idx": inlet_idx}
+        for (src, outlet_idx), (dst, inlet_idx) in (
+            (line["patchline"]["source"], line["patchline"]["destination"])
+            for line in selection.get("lines") or []
+        )
+        if src in refs and dst in refs
+    ]
+    return Template(name, objects, connections, description=description)
+
+
+@mcp.tool()
+def list_templates(ctx: Context) -> list:
+    """List the patch templates that instantiate_template can add: reusable groups
+    of objects and patch cords, e.g. an oscillator into a gain into a dac~.
+
+    Returns:
+        list: For each template its name, description, parameters with their
+            defaults, refs (the local names of its objects) and warnings if any.
+    """
+    return template_registry.list()
+
+
+@mcp.tool()
+async def instantiate_template(
+    ctx: Context,
+    name: str,
+    origin: list = [0, 0],
+    params: dict = None,
+    prefix: str = None,
+    target: str = None,
+):
+    """Add a patch template (see list_templates) with a single operation.
+
+    Prefer this over building common idioms object by object. The varnames of the
+    new objects are the template refs prefixed with `prefix` and "_"; use them to
+    connect the new objects to the rest of the patch.
+
+    Args:
+        name (str): Name of the template.
+        origin (list): Position [x, y] of the template's top-left corner.
+        params (dict, optional): Values of the template parameters; the others keep
+            their defaults.
+        prefix (str, optional): Prefix of the new varnames. Defaults to the template
+            name and a random suffix.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        dict: success, "varnames" (ref -> varname of each new object) and the
+            operations that failed in Max, if any.
+    """
+    template = template_registry.get(name)
+    if template is None:
+        raise ValueError(
+            f"Unknown template: {name}. Templates: {', '.join(template_registry.names()) or 'none'}."
+        )
+    if len(origin) != 2:
+        raise ValueError("Origin must be a list of two numbers.")
+    prefix = prefix or f"{name}_{uuid.uuid4().hex[:6]}"
+    return await call_target(ctx, target, "instantiate_template", template, prefix, origin, params)
+
+
+@mcp.tool()
+async def save_template(
+    ctx: Context,
+    name: str,
+    description: str = "",
+    overwrite: bool = False,
+    target: str = None,
+):
+    """Save the objects and patch cords selected in Max as a template, for
+    instantiate_template. Attributes are not captured.
+
+    To give the template parameters, edit its file in the templates directory: add
+    "params" with their defaults, e.g. {"freq": 440}, and write "$freq" in place of
+    an argument.
+
+    Args:
+        name (str): Name of the template: letters, digits, "_", "-" or ".".
+        description (str): What the template does.
+        overwrite (bool): Replace an existing template of the same name.
+        target (str, optional): Name of the Max instance to capture from. Defaults
+            to the first one.
+
+    Returns:
+        dict: The new template's name, description, parameters and refs.
+    """
+    if target == BROADCAST_TARGET:
+        raise ValueError("Capture a template from one Max instance at a time.")
+    selection = await send_request_to(ctx, {"action": "get_objects_in_selected"}, target)
+    template = template_from_selection(selection, name, description)
+    template_registry.save(template, overwrite)
+    return template.summary()
 
 
 @mcp.tool()
-def list_all_objects(ctx: Context) -> list:
+def list_all_objects(
+    ctx: Context,
+    category: str = None,
+    prefix: str = None,
+    signal_only: bool = False,
+    offset: int = 0,
+    limit: int = None,
+):
     """Returns a name list of all objects that can be added in Max.
-    To understand a specific object in the list, use the `get_object_doc` tool."""
-    return list(flattened_docs.keys())
+    To understand a specific object in the list, use the `get_object_doc` tool.
+    The list is long: narrow it with the filters below, or use `search_object_docs`.
+
+    Args:
+        category (str, optional): Only objects of this category, as listed by
+            `list_object_categories`.
+        prefix (str, optional): Only objects whose name starts with it, e.g. "jit.".
+        signal_only (bool): Only MSP objects (names ending with "~").
+        offset (int): Number of names to skip, 0 or more.
+        limit (int, optional): Maximum number of names, 1 or more; enables paging.
+
+    Returns:
+        list: Object names. When paging, a dict with the "names", the "total" number
+        of matching objects and the "next_offset" (null on the last page).
+    """
+    if offset < 0 or (limit is not None and limit < 1):
+        return {"success": False, "error": "offset must be 0 or more and limit 1 or more."}
+    if category is not None and category not in docs_index.catalog():
+        return {
+            "success": False,
+            "error": f"Unknown category: {category}",
+            "categories": list(docs_index.catalog()),
+        }
+    names = docs_index.list_names(category, prefix, signal_only)
+    if limit is None:
+        return names[offset:]
+    end = offset + limit
+    return {
+        "names": names[offset:end],
+        "total": len(names),
+        "next_offset": end if end < len(names) else None,
+    }
 
 
 @mcp.tool()
-def get_object_doc(ctx: Context, object_name: str) -> dict:
+def list_object_categories(ctx: Context) -> dict:
+    """List the categories of Max objects with the number of objects in each.
+    Use a category with `list_all_objects` to list its objects.
+
+    Returns:
+        dict: Category name -> number of objects.
+    """
+    return {category: len(names) for category, names in docs_index.catalog().items()}
+
+
+@mcp.tool()
+def get_object_doc(
+    ctx: Context, object_name: str, view: str = "full", fields: list = None
+) -> dict:
     """Retrieve the official documentation for a given object.
     Use this resource to understand how a specific object works, including its
     description, inlets, outlets, arguments, methods(messages), and attributes.
+    Use view="signature" when only the inlets, outlets and arguments are needed:
+    it is much smaller than the full documentation.
 
     Args:
         object_name (str): Name of the object to look up.
+        view (str): "full" for the whole documentation, or "signature" for the name,
+            digest, inlets, outlets and arguments only.
+        fields (list, optional): Top-level fields to return instead of a view, e.g.
+            ["methods"] or ["attributes", "description"].
 
     Returns:
         dict: Official documentations for the specified object.
     """
-    try:
-        return flattened_docs[object_name]
-    except KeyError:
+    if view not in ("full", "signature"):
+        return {"success": False, "error": f"Unknown view: {view}. Use \"full\" or \"signature\"."}
+    if object_name not in docs_index:
         return {
             "success": False,
             "error": "Invalid object name",
             "suggestion": "Make sure the object name is a valid Max object name.",
+            "suggestions": docs_index.suggest(object_name),
         }
+    if fields:
+        doc = flattened_docs[object_name]
+        return {"name": object_name, **{f: doc[f] for f in fields if f in doc}}
+    if view == "signature":
+        return docs_index.signature(object_name)
+    return flattened_docs[object_name]
+
+
+@mcp.tool()
+def search_object_docs(ctx: Context, query: str, limit: int = 10) -> list:
+    """Search the documentation of Max objects, e.g. "sine oscillator" or "delay line".
+    Use this to find which object does something, then `get_object_doc` for details.
+
+    Args:
+        query (str): Words to look for in object names, digests, descriptions,
+            methods and attributes.
+        limit (int): Maximum number of results.
+
+    Returns:
+        list: Matching objects, best first, with their name, category, digest and score.
+    """
+    return docs_index.search(query, limit)
 
 
 @mcp.tool()
 async def get_objects_in_patch(
     ctx: Context,
+    consistency: str = "eventual",
+    cursor: str = None,
+    limit: int = None,
+    target: str = None,
 ):
     """Retrieve the list of existing objects in the current Max patch.
 
@@ -367,67 +2055,254 @@ async def get_objects_in_patch(
     position(patching_rect), and the boxtext when available, as well as a
     list of patch cords with their source and destination information.
 
+    For large patches, read it in pages: pass a limit (e.g. 500) to get the first
+    page, then pass the returned "next_cursor" as cursor to get the next one, until
+    next_cursor is null. All pages come from the same snapshot ("version"); a page
+    holds the patch cords going out of its boxes.
+
+    Args:
+        consistency (str, optional): "eventual" (default) answers from the server's
+            copy of the patch, kept up to date with the changes made through this
+            server; "strong" asks Max, e.g. after editing the patch by hand.
+        cursor (str, optional): The next_cursor of the previous page.
+        limit (int, optional): Maximum number of boxes per page, 1 or more; enables
+            paging.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
     Returns:
-        list: A list of objects and patch cords.
+        list: A list of objects and patch cords. When paging, also the "total"
+        number of boxes and the "next_cursor".
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
-    payload = {"action": "get_objects_in_patch"}
-    response = await maxmsp.send_request(payload)
+    if limit is not None and limit < 1:
+        return {"success": False, "error": "limit must be 1 or more."}
+    if cursor is not None or limit is not None:
+        response = await call_target(
+            ctx, target, "get_patch_page", cursor, limit, ctx.report_progress
+        )
+        return [response]
+
+    # long snapshots stream progress (number of boxes collected so far)
+    response = await call_target(
+        ctx, target, "get_patch", consistency, on_progress=ctx.report_progress
+    )
 
     return [response]
 
 
+@mcp.tool()
+async def get_patch_changes(
+    ctx: Context,
+    since_version: int = 0,
+    target: str = None,
+):
+    """Retrieve only what changed in the current Max patch since a version.
+
+    Every snapshot from get_objects_in_patch and every result of this tool carries
+    the current "version" of the patch. Pass the last version you have seen to get
+    the boxes and patch cords added, removed or moved since then, which is much
+    smaller than the whole patch. When the changes are too old to be known, the
+    whole patch is returned instead, with "full" set to true.
+
+    Args:
+        since_version (int): The last version seen; 0 to get everything.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        dict: "version", "full", and either "changes" (each with a "type" of
+        box_added, box_removed, box_moved, line_added or line_removed) or, when
+        full, "boxes" and "lines".
+    """
+    return await call_target(ctx, target, "get_patch_changes", since_version)
+
+
 @mcp.tool()
 async def get_objects_in_selected(
     ctx: Context,
+    target: str = None,
 ):
     """Retrieve the list of objects that is selected in a (unlocked) patcher window.
 
     Use this when the user wanted to reference to the selected objects.
 
+    Args:
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
     Returns:
         list: A list of objects and patch cords.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
     payload = {"action": "get_objects_in_selected"}
-    response = await maxmsp.send_request(payload)
+    response = await send_request_to(ctx, payload, target)
 
     return [response]
 
 
 @mcp.tool()
-async def get_object_attributes(ctx: Context, varname: str):
+async def get_object_attributes(
+    ctx: Context,
+    varname: str,
+    consistency: str = "eventual",
+    target: str = None,
+):
     """Retrieve an objects' attributes and values of the attributes.
 
     Use this to understand the state of an object.
 
+    Args:
+        varname (str): Variable name of the object.
+        consistency (str, optional): "eventual" (default) answers from the server's
+            copy of the patch, kept up to date with the changes made through this
+            server; "strong" asks Max, e.g. after editing the patch by hand.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
     Returns:
         list: A list of attributes name and attributes values.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
-    payload = {"action": "get_object_attributes"}
-    kwargs = {"varname": varname}
-    payload.update(kwargs)
-    response = await maxmsp.send_request(payload)
+    response = await call_target(ctx, target, "get_attributes", varname, consistency)
 
     return [response]
 
 
 @mcp.tool()
-async def get_avoid_rect_position(ctx: Context):
+async def get_avoid_rect_position(
+    ctx: Context,
+    consistency: str = "eventual",
+    target: str = None,
+):
     """When deciding the position to add a new object to the path, this rectangular area
     should be avoid. This is useful when you want to add an object to the patch without
     overlapping with existing objects.
 
+    Args:
+        consistency (str, optional): "eventual" (default) answers from the server's
+            copy of the patch, kept up to date with the changes made through this
+            server; "strong" asks Max, e.g. after editing the patch by hand.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
     Returns:
         list: A list of four numbers representing the left, top, right, bottom of the rectangular area.
     """
-    maxmsp = ctx.request_context.lifespan_context.get("maxmsp")
-    payload = {"action": "get_avoid_rect_position"}
-    response = await maxmsp.send_request(payload)
+    response = await call_target(ctx, target, "get_avoid_rect", consistency)
 
     return response
 
 
+@mcp.tool()
+async def find_free_position(
+    ctx: Context,
+    size: list = [60, 22],
+    near: str = None,
+    target: str = None,
+):
+    """Find a position where a new object does not overlap existing objects.
+
+    The position returned is the closest free one to the object `near` (below it,
+    or next to it when the space below is taken), or to the top left corner of the
+    patch. It also avoids the area returned by get_avoid_rect_position().
+
+    Args:
+        size (list): Expected [width, height] of the new object.
+        near (str, optional): Variable name of the object to place the new one next to.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        list: The [x, y] position to use with add_max_object.
+    """
+    return await call_target(ctx, target, "find_free_position", size, near)
+
+
+@mcp.tool()
+async def layout_objects(
+    ctx: Context,
+    varnames: list = None,
+    origin: list = None,
+    target: str = None,
+):
+    """Tidy up the patch: arrange objects top to bottom following their patch cords,
+    with as few crossing cords as possible.
+
+    Sources go in the top row and each object goes below the objects feeding it.
+    All objects are moved in one operation. Use it after building a large subgraph
+    instead of setting "patching_rect" object by object.
+
+    Args:
+        varnames (list, optional): Variable names of the objects to arrange.
+            Defaults to every object in the patch, not counting the ones inside
+            subpatchers.
+        origin (list, optional): [x, y] of the top left corner of the arranged
+            objects. Defaults to the top left corner of their current bounding box.
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        dict: The success flag of the move and the number of objects moved.
+    """
+    return await call_target(ctx, target, "layout_patch", varnames, origin)
+
+
+@mcp.tool()
+def list_max_endpoints(ctx: Context) -> list:
+    """List the Max instances this server is connected to, with their health.
+
+    Use the names as the `target` argument of other tools.
+
+    Returns:
+        list: One entry per instance with its name, address, connection state,
+        smoothed round trip time in milliseconds and recent timeouts.
+    """
+    registry = get_registry(ctx)
+    return [
+        {
+            "name": name,
+            "address": f"{maxmsp.server_url}:{maxmsp.server_port}",
+            "default": name == registry.default,
+            "connected": maxmsp.connected,
+            "rtt_ms": None if maxmsp.rtt is None else round(maxmsp.rtt * 1000, 2),
+            "failures": maxmsp.failures,
+        }
+        for name, maxmsp in registry.connections.items()
+    ]
+
+
+@mcp.tool()
+async def get_latency_stats(ctx: Context, target: str = None) -> dict:
+    """Report the measured round trip times to Max, per action.
+    See get_server_metrics for call counts, errors and sizes.
+
+    Args:
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        dict: For each action, the number of recent samples, the p50/p95/p99
+        latencies in milliseconds and the timeout currently applied in seconds.
+    """
+    return await call_target(ctx, target, "latency_stats")
+
+
+@mcp.tool()
+async def get_server_metrics(ctx: Context, target: str = None) -> dict:
+    """Report the server's metrics: for each tool and for each kind of message
+    sent to Max, the number of calls, errors and timeouts, the bytes sent and
+    received, and a latency histogram with p50/p95/p99 in milliseconds.
+
+    Args:
+        target (str, optional): Name of the Max instance to use; "all" sends to every
+            instance, "fastest" to the one answering fastest. Defaults to the first one.
+
+    Returns:
+        dict: "tools" metrics, and "max" metrics with the health of the connection.
+    """
+    return {
+        "tools": mcp.tool_metrics.snapshot(),
+        "max": await call_target(ctx, target, "metrics_snapshot"),
+    }
+
+
 if __name__ == "__main__":
     mcp.run()
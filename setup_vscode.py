@@ -112,7 +112,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 try:
-    from server import MaxMSPConnection, mcp, docs, flattened_docs
+    from server import MaxMSPConnection, mcp, flattened_docs
     print("✅ Servidor MCP importado com sucesso", file=sys.stderr)
 except ImportError as e:
     print(f"❌ Erro ao importar servidor MCP: {e}", file=sys.stderr)
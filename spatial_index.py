@@ -0,0 +1,118 @@
+# spatial_index.py
+from collections import defaultdict
+import math
+
+
+class SpatialGrid:
+    """Uniform grid over the rectangles of the boxes in a patch.
+
+    Rectangles are [left, top, right, bottom], as in Max's obj.rect. Each one
+    is registered in every cell it overlaps, so overlap queries only look at the
+    few boxes near the queried area.
+    """
+
+    def __init__(self, cell_size: int = 128):
+        self.cell_size = cell_size
+        self.cells = defaultdict(set)  # (column, row) -> keys
+        self.rects = {}  # key -> rect
+
+    def _cells(self, rect):
+        size = self.cell_size
+        left, top, right, bottom = rect
+        for column in range(math.floor(left / size), math.floor(right / size) + 1):
+            for row in range(math.floor(top / size), math.floor(bottom / size) + 1):
+                yield column, row
+
+    def insert(self, key, rect):
+        self.remove(key)
+        self.rects[key] = rect
+        for cell in self._cells(rect):
+            self.cells[cell].add(key)
+
+    def remove(self, key):
+        rect = self.rects.pop(key, None)
+        if rect is None:
+            return
+        for cell in self._cells(rect):
+            keys = self.cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self.cells[cell]
+
+    def clear(self):
+        self.cells.clear()
+        self.rects.clear()
+
+    def query(self, rect) -> set:
+        """Keys of the rectangles overlapping rect."""
+        left, top, right, bottom = rect
+        found = set()
+        for cell in self._cells(rect):
+            for key in self.cells.get(cell, ()):
+                other = self.rects[key]
+                if (
+                    other[0] < right
+                    and left < other[2]
+                    and other[1] < bottom
+                    and top < other[3]
+                ):
+                    found.add(key)
+        return found
+
+    def is_free(self, rect, margin: float = 0) -> bool:
+        left, top, right, bottom = rect
+        return not self.query((left - margin, top - margin, right + margin, bottom + margin))
+
+    def find_free(self, size, anchor, margin: float = 10, max_distance: float = 16384) -> list:
+        """Top-left [x, y] of the free position for a box of the given
+        [width, height] closest to anchor, keeping `margin` around other boxes.
+
+        The closest free position lies on the anchor's row or just below or above
+        another box, so only those rows are swept, nearest first, within windows
+        growing around the anchor until a position is found inside one.
+        """
+        width, height = size
+        x0, y0 = anchor
+        window = 256
+        while window <= max_distance:
+            nearby = self.query((x0 - window, y0 - window, x0 + window, y0 + window))
+            rows = {y0}
+            for key in nearby:
+                top, bottom = self.rects[key][1], self.rects[key][3]
+                rows.add(bottom + margin)
+                rows.add(top - margin - height)
+            best, best_distance = None, math.inf
+            for y in sorted((y for y in rows if y >= 0), key=lambda y: abs(y - y0)):
+                if abs(y - y0) >= best_distance:
+                    break
+                x = self._free_x_in_row(y, width, height, x0, margin, window)
+                if x is None:
+                    continue
+                distance = math.hypot(x - x0, y - y0)
+                if distance < best_distance:
+                    best, best_distance = [x, y], distance
+            if best is not None and best_distance <= window:
+                return best
+            window *= 4
+        raise ValueError("No free position found near the anchor.")
+
+    def _free_x_in_row(self, y, width, height, x0, margin, window):
+        """The x closest to x0 where [x, y, x + width, y + height] is free, looking
+        only within `window` of x0."""
+        band = (x0 - window, y - margin, x0 + window, y + height + margin)
+        blocked = sorted(
+            (self.rects[key][0] - margin, self.rects[key][2] + margin)
+            for key in self.query(band)
+        )
+        # outside the window is unknown, hence blocked; left of 0 is off the patch
+        blocked.append((x0 + window, math.inf))
+        best = None
+        start = max(0, x0 - window)
+        for left, right in blocked:
+            if left - start >= width:
+                # free gap [start, left]: the x in it closest to x0
+                x = min(max(x0, start), left - width)
+                if best is None or abs(x - x0) < abs(best - x0):
+                    best = x
+            start = max(start, right)
+        return best
@@ -0,0 +1,79 @@
+# streaming.py
+import asyncio
+
+
+class ParameterStream:
+    """Values of number boxes streamed to Max, latest value wins.
+
+    Updates only replace the pending value of their varname; every pending
+    value is sent in a single set_numbers command, at most `rate` times per
+    second. The first update after a quiet period is sent right away. While
+    disconnected, values keep being coalesced and the latest ones are sent on
+    reconnection.
+    """
+
+    def __init__(self, send, connected: asyncio.Event, rate: float):
+        self._send = send  # async callable taking the set_numbers command
+        self._connected = connected
+        self.rate = rate
+        self._pending = {}  # varname -> latest value not sent yet
+        self._task = None
+        self._last_flush = None
+        self.updates = 0
+        self.flushes = 0
+        self.values_sent = 0
+
+    def update(self, values: dict):
+        """Set the next values of some varnames; returns immediately."""
+        self._pending.update(values)
+        self.updates += len(values)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def stream(self, varname: str) -> "Parameter":
+        """A handle updating one varname, for loops driving a single parameter."""
+        return Parameter(self, varname)
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while self._pending:
+            if self._last_flush is not None:
+                wait = self._last_flush + 1 / self.rate - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            await self._connected.wait()
+            values, self._pending = self._pending, {}
+            self._last_flush = loop.time()
+            await self._send({"action": "set_numbers", "values": values})
+            self.flushes += 1
+            self.values_sent += len(values)
+
+    async def flush(self):
+        """Wait until every pending value has been sent."""
+        while self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "rate_hz": self.rate,
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "values_sent": self.values_sent,
+            "coalesced": self.updates - self.values_sent - len(self._pending),
+            "pending": len(self._pending),
+        }
+
+
+class Parameter:
+    """One varname of a ParameterStream."""
+
+    def __init__(self, stream: ParameterStream, varname: str):
+        self.stream = stream
+        self.varname = varname
+
+    def set(self, value):
+        self.stream.update({self.varname: value})
@@ -0,0 +1,201 @@
+# templates.py
+import json
+import logging
+import os
+import re
+
+# An argument or attribute value "$name" is replaced by the parameter `name`
+PARAMETER = re.compile(r"\$([A-Za-z_]\w*)")
+# Template names are file names in the templates directory
+TEMPLATE_NAME = re.compile(r"[\w.-]+")
+
+
+class Template:
+    """A reusable group of objects, patch cords and attributes, described as for
+    build_subgraph, with positions relative to the template's top-left corner.
+
+    The operations are compiled and checked once, with the refs as varnames;
+    instantiating only renames, offsets and fills in the parameters.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        objects: list,
+        connections: list = (),
+        attributes: list = (),
+        params: dict = None,
+        description: str = "",
+    ):
+        if not TEMPLATE_NAME.fullmatch(name or ""):
+            raise ValueError(f"Invalid template name: {name!r}")
+        self.name = name
+        self.objects = list(objects)
+        self.connections = list(connections)
+        self.attributes = list(attributes)
+        self.params = dict(params or {})
+        self.description = description
+        self.operations = None  # compiled by prepare()
+        self.warnings = []  # e.g. object types missing from the docs
+        self._refs = {}  # ref -> index of its add_object operation
+        self._slots = []  # (operation index, key, list index or None, parameter)
+
+    @classmethod
+    def from_dict(cls, data: dict, name: str = None) -> "Template":
+        return cls(
+            data.get("name") or name,
+            data.get("objects") or [],
+            data.get("connections") or [],
+            data.get("attributes") or [],
+            data.get("params"),
+            data.get("description", ""),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "params": self.params,
+            "objects": self.objects,
+            "connections": self.connections,
+            "attributes": self.attributes,
+        }
+
+    def summary(self) -> dict:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "params": self.params,
+            "refs": list(self._refs),
+            "warnings": self.warnings,
+        }
+
+    def prepare(self, operations: list):
+        """Keep the compiled operations, checking that they only refer to the
+        template's own objects and defined parameters."""
+        refs = {op["varname"]: i for i, op in enumerate(operations) if op["action"] == "add_object"}
+        slots = []
+        for i, op in enumerate(operations):
+            for key in ("varname", "src_varname", "dst_varname"):
+                if key in op and op[key] not in refs:
+                    raise ValueError(f"{op['action']} refers to {op[key]}, which is not in the template.")
+            key = "args" if op["action"] == "add_object" else "attr_value"
+            value = op.get(key)
+            for j, item in enumerate(value) if isinstance(value, list) else [(None, value)]:
+                match = PARAMETER.fullmatch(item) if isinstance(item, str) else None
+                if not match:
+                    continue
+                if match.group(1) not in self.params:
+                    raise ValueError(f"{item} is not a parameter of the template.")
+                slots.append((i, key, j, match.group(1)))
+        self.operations = operations
+        self._refs = refs
+        self._slots = slots
+
+    def instantiate(self, prefix: str, origin: list, params: dict = None) -> tuple:
+        """(operations, ref -> varname) adding the template at origin, its refs
+        prefixed to make varnames and its parameters set from params or defaults."""
+        unknown = set(params or ()) - set(self.params)
+        if unknown:
+            raise ValueError(
+                f"Unknown parameters for {self.name}: {', '.join(sorted(unknown))}. "
+                f"Parameters: {', '.join(self.params) or 'none'}."
+            )
+        values = {**self.params, **(params or {})}
+        varnames = {ref: f"{prefix}_{ref}" for ref in self._refs}
+        x0, y0 = origin
+        operations = []
+        for op in self.operations:
+            op = dict(op)
+            for key in ("varname", "src_varname", "dst_varname"):
+                if key in op:
+                    op[key] = varnames[op[key]]
+            if "position" in op:
+                x, y = op["position"]
+                op["position"] = [x0 + x, y0 + y]
+            operations.append(op)
+        for i, key, j, param in self._slots:
+            op = operations[i]
+            if j is None:
+                op[key] = values[param]
+                continue
+            if op[key] is self.operations[i][key]:
+                op[key] = list(op[key])  # never change the template's own lists
+            op[key][j] = values[param]
+        return operations, varnames
+
+
+class TemplateRegistry:
+    """Templates read from the *.json files of a directory, one per file, named
+    after the file unless it says otherwise.
+
+    Files are read and prepared on first use and again when a file of the
+    directory is added, removed or modified; templates failing to prepare are
+    logged and skipped. `prepare` compiles and checks a template.
+    """
+
+    def __init__(self, directory: str, prepare):
+        self.directory = directory
+        self.prepare = prepare
+        self._templates = {}
+        self._stamp = None
+
+    def _scan(self) -> tuple:
+        try:
+            with os.scandir(self.directory) as entries:
+                return tuple(
+                    sorted(
+                        (e.name, e.stat().st_mtime_ns)
+                        for e in entries
+                        if e.name.endswith(".json") and e.is_file()
+                    )
+                )
+        except FileNotFoundError:
+            return ()
+
+    def _refresh(self):
+        stamp = self._scan()
+        if stamp == self._stamp:
+            return
+        templates = {}
+        for file_name, _ in stamp:
+            path = os.path.join(self.directory, file_name)
+            try:
+                with open(path, "r") as f:
+                    template = Template.from_dict(json.load(f), os.path.splitext(file_name)[0])
+                self.prepare(template)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logging.warning(f"Skipping template {path}: {e}")
+                continue
+            templates[template.name] = template
+        self._templates = templates
+        self._stamp = stamp
+
+    def get(self, name: str) -> Template:
+        """The template called name, or None."""
+        self._refresh()
+        return self._templates.get(name)
+
+    def names(self) -> list:
+        self._refresh()
+        return sorted(self._templates)
+
+    def list(self) -> list:
+        self._refresh()
+        return [self._templates[name].summary() for name in sorted(self._templates)]
+
+    def save(self, template: Template, overwrite: bool = False):
+        """Prepare a template and write it to the directory."""
+        self._refresh()
+        if template.name in self._templates and not overwrite:
+            raise ValueError(f"Template {template.name} already exists.")
+        self.prepare(template)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{template.name}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(template.to_dict(), f, indent=2)
+            f.write("\n")
+        os.replace(tmp_path, path)
+        self._templates[template.name] = template
+        self._stamp = self._scan()
@@ -0,0 +1,112 @@
+import asyncio
+import socket
+
+import pytest
+
+from benchmarks.fake_max import FakeMax
+from server import BATCH_CHUNK_SIZE, NAMESPACE, MaxMSPConnection
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def with_fake_max(scenario, size: int = 3):
+    """Run scenario(fake, conn) against a FakeMax patch of size boxes."""
+
+    async def run():
+        fake = FakeMax(free_port())
+        fake.patch.seed(size)
+        await fake.start()
+        conn = MaxMSPConnection("http://127.0.0.1", fake.port, NAMESPACE, ack=False)
+        try:
+            await conn.start_server()
+            await asyncio.wait_for(conn._connected.wait(), 5)
+            await scenario(fake, conn)
+        finally:
+            await conn.close()
+            await fake.stop()
+
+    asyncio.run(run())
+
+
+def test_eventual_read_drops_commands_max_rejected():
+    async def scenario(fake, conn):
+        await conn.get_patch()
+        # fire-and-forget, and rejected by Max: neither object exists
+        await conn.send_command({"action": "connect_objects", "src_varname": "ghost1",
+                                 "outlet_idx": 0, "dst_varname": "ghost2", "inlet_idx": 0})
+        await conn.send_command({"action": "add_object", "obj_type": "cycle~", "args": [],
+                                 "position": [0, 0], "varname": "osc"})
+        await asyncio.sleep(0.1)
+        del fake.patch.boxes["osc"]  # as if Max had failed to create it
+        patch = await conn.get_patch()
+        assert {b["box"]["varname"] for b in patch["boxes"]} == set(fake.patch.boxes)
+        assert len(patch["lines"]) == len(fake.patch.lines)
+        assert conn.mirror.unconfirmed == 0
+
+    with_fake_max(scenario)
+
+
+SPEC = {
+    "objects": [
+        {"varname": "obj-0", "obj_type": "*~", "args": [0]},
+        {"varname": "obj-1", "obj_type": "cycle~", "args": [1]},
+        {"varname": "obj-2", "obj_type": "*~", "args": [2]},
+    ],
+    "connections": [{"src": "obj-0", "dst": "obj-1"}, {"src": "obj-1", "dst": "obj-2"}],
+    "attributes": [{"target": "obj-1", "attr_name": "bgcolor", "attr_value": [1, 0, 0, 1]}],
+}
+
+
+def test_apply_patch_state_sends_only_attributes_that_differ():
+    async def scenario(fake, conn):
+        fake.patch.attributes["obj-1"]["bgcolor"] = [1, 0, 0, 1]
+        await conn.get_attributes("obj-1", "strong")
+        result = await conn.apply_patch_state(**SPEC, dry_run=True)
+        assert result["operations"] == []
+
+        fake.patch.attributes["obj-1"]["bgcolor"] = [0, 0, 0, 1]
+        await conn.get_attributes("obj-1", "strong")
+        result = await conn.apply_patch_state(**SPEC)
+        assert result["success"] and result["operations"] == {"set_object_attribute": 1}
+        assert fake.patch.attributes["obj-1"]["bgcolor"] == [1, 0, 0, 1]
+
+    with_fake_max(scenario)
+
+
+def test_patch_pages_need_a_positive_limit():
+    async def scenario(fake, conn):
+        for limit in (0, -5):
+            with pytest.raises(ValueError, match="limit must be 1 or more"):
+                await conn.get_patch_page(limit=limit)
+        page = await conn.get_patch_page(limit=2)
+        assert len(page["boxes"]) == 2 and page["next_cursor"]
+
+    with_fake_max(scenario)
+
+
+def test_failed_batch_chunk_reports_each_of_its_operations():
+    async def scenario(fake, conn):
+        send_request = conn.send_request
+
+        async def flaky(payload, **kwargs):
+            if payload["operations"][0]["varname"] == f"n{BATCH_CHUNK_SIZE}":
+                raise TimeoutError("No response received in 1.00 seconds.")
+            return await send_request(payload, **kwargs)
+
+        conn.send_request = flaky
+        operations = [
+            {"action": "add_object", "obj_type": "cycle~", "args": [], "position": [0, 10 * i], "varname": f"n{i}"}
+            for i in range(2 * BATCH_CHUNK_SIZE + 10)
+        ]
+        results = await conn.apply_batch(operations, check=False)
+        assert [r["index"] for r in results] == list(range(len(operations)))
+        failed = [r["index"] for r in results if not r["success"]]
+        assert failed == list(range(BATCH_CHUNK_SIZE, 2 * BATCH_CHUNK_SIZE))
+        assert results[BATCH_CHUNK_SIZE]["error"].startswith("No response")
+        assert f"n{2 * BATCH_CHUNK_SIZE}" in fake.patch.boxes
+
+    with_fake_max(scenario)
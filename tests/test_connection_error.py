@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import server
+from docs_index import DocsIndex
+
+
+def port(kind: str) -> dict:
+    return {"type": kind}
+
+
+DOCS = {
+    "MSP": [
+        {"name": "cycle~", "inletlist": [port("signal/float"), port("signal/float")], "outletlist": [port("signal")]},
+        {"name": "gen~", "inletlist": [port("signal")], "outletlist": [port("signal")]},
+    ],
+    "Max": [
+        {"name": "metro", "inletlist": [port("bang"), port("int")], "outletlist": [port("bang")]},
+        {"name": "trigger", "inletlist": [port("anything")], "outletlist": [port("anything")]},
+    ],
+}
+
+
+@pytest.fixture(autouse=True)
+def docs(tmp_path, monkeypatch):
+    path = tmp_path / "docs.json"
+    path.write_text(json.dumps(DOCS))
+    monkeypatch.setattr(server, "docs_index", DocsIndex(str(path)))
+
+
+def box(text: str) -> dict:
+    return {"maxclass": "newobj", "text": text}
+
+
+def test_documented_ports_are_accepted():
+    assert server.connection_error(box("cycle~ 440"), 0, box("cycle~"), 1) is None
+
+
+def test_negative_indices():
+    assert "0 or more" in server.connection_error(box("metro 100"), -1, box("cycle~"), 0)
+
+
+def test_missing_ports_of_boxes_without_arguments():
+    assert server.connection_error(box("cycle~"), 1, box("metro"), 0) == (
+        "cycle~ has 1 outlet(s), no outlet 1."
+    )
+    assert server.connection_error(box("metro"), 0, box("cycle~"), 2) == (
+        "cycle~ has 2 inlet(s), no inlet 2."
+    )
+
+
+def test_arguments_may_add_ports():
+    assert server.connection_error(box("trigger b b b"), 2, box("metro"), 0) is None
+
+
+def test_content_defined_classes_are_not_range_checked():
+    assert server.connection_error(box("gen~"), 3, box("gen~"), 2) is None
+
+
+def test_signal_into_a_control_inlet():
+    assert "does not accept signals" in server.connection_error(box("cycle~"), 0, box("metro"), 0)
+
+
+def test_undocumented_classes_cannot_be_judged():
+    assert server.connection_error(box("myabstraction"), 5, box("metro"), 0) is None
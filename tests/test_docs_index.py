@@ -0,0 +1,19 @@
+from docs_index import TrigramIndex
+
+NAMES = ("cycle~", "saw~", "phasor~", "dac~", "adc~", "metro", "jit.matrix")
+
+
+def test_suggests_close_names():
+    index = TrigramIndex(NAMES)
+    assert index.suggest("cylce~")[0] == "cycle~"
+    assert index.suggest("metor") == ["metro"]
+    assert index.suggest("JIT.MATRIX") == ["jit.matrix"]
+
+
+def test_no_suggestion_when_nothing_is_close():
+    assert TrigramIndex(NAMES).suggest("zzzzzz") == []
+
+
+def test_at_most_k_suggestions():
+    index = TrigramIndex(NAMES)
+    assert len(index.suggest("dac~", k=1)) == 1
@@ -0,0 +1,40 @@
+import time
+
+from layout import layered_layout
+
+
+def test_rows_follow_the_patch_cords():
+    rects = {
+        "a": [0, 0, 50, 22],
+        "b": [300, 300, 350, 322],
+        "c": [10, 500, 60, 522],
+        "d": [200, 0, 250, 22],
+    }
+    # c -> a closes a cycle, broken against the flow; x is not a box to place
+    lines = {("a", 0, "b", 0), ("b", 0, "c", 0), ("c", 0, "a", 0), ("x", 0, "a", 0)}
+    positions = layered_layout(rects, lines, origin=(10, 20), h_gap=20, v_gap=40)
+    assert set(positions) == set(rects)
+    assert positions["a"][1] == positions["d"][1] == 20
+    assert positions["b"][1] == 20 + 22 + 40
+    assert positions["c"][1] == positions["b"][1] + 22 + 40
+    assert min(x for x, _ in positions.values()) == 10
+
+
+def test_boxes_of_a_row_do_not_overlap():
+    rects = {name: [0, 0, 60, 22] for name in ("src", "l", "m", "r")}
+    lines = [("src", i, name, 0) for i, name in enumerate(("l", "m", "r"))]
+    positions = layered_layout(rects, lines, h_gap=20)
+    row = sorted(positions[name][0] for name in ("l", "m", "r"))
+    assert all(right - left >= 60 + 20 for left, right in zip(row, row[1:]))
+
+
+def test_long_cords_do_not_add_rows_of_dummies():
+    # a chain of 2000 boxes, one per row, with cords skipping most of it
+    names = [f"o{i}" for i in range(2000)]
+    rects = {name: [0, 0, 50, 22] for name in names}
+    lines = [(a, 0, b, 0) for a, b in zip(names, names[1:])]
+    lines += [(names[i], 0, names[-1 - i], 1) for i in range(500)]
+    start = time.perf_counter()
+    positions = layered_layout(rects, lines)
+    assert time.perf_counter() - start < 2
+    assert [positions[name][1] for name in names] == sorted(positions[name][1] for name in names)
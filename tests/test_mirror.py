@@ -0,0 +1,57 @@
+from server import PatchMirror
+
+SNAPSHOT = {
+    "boxes": [
+        {"box": {"maxclass": "newobj", "varname": "osc", "patching_rect": [0, 0, 50, 22], "text": "cycle~ 440"}},
+        {"box": {"maxclass": "newobj", "varname": "sub", "patching_rect": [0, 50, 50, 72], "text": "p sub"}},
+        {"box": {"maxclass": "newobj", "varname": "inner", "patching_rect": [0, 0, 50, 22], "nested": True}},
+    ],
+    "lines": [
+        {"patchline": {"source": ["osc", 0], "destination": ["sub", 0]}},
+        {"patchline": {"source": ["inner", 0], "destination": ["osc", 0]}},
+    ],
+    "version": 3,
+}
+
+
+def test_top_level_leaves_out_boxes_of_subpatchers():
+    mirror = PatchMirror()
+    mirror.load_snapshot(SNAPSHOT)
+    boxes, lines = mirror.top_level()
+    assert set(boxes) == {"osc", "sub"}
+    assert lines == {("osc", 0, "sub", 0)}
+
+
+def test_optimistic_changes_stay_unconfirmed_until_acknowledged():
+    mirror = PatchMirror()
+    mirror.load_snapshot(SNAPSHOT)
+    add = {"action": "add_object", "obj_type": "dac~", "position": [0, 100], "varname": "out"}
+    assert mirror.apply_command(add)
+    assert not mirror.apply_command({"action": "send_message_to_object", "varname": "osc"})
+    assert mirror.unconfirmed == 1
+    mirror.confirm()
+    assert mirror.unconfirmed == 0
+    mirror.apply_command({"action": "remove_object", "varname": "out"})
+    assert mirror.unconfirmed == 1
+    mirror.load_snapshot(SNAPSHOT)
+    assert mirror.unconfirmed == 0
+    assert "out" not in mirror.boxes
+
+
+def test_cords_to_unknown_boxes_are_not_mirrored():
+    mirror = PatchMirror()
+    mirror.load_snapshot(SNAPSHOT)
+    connect = {"action": "connect_objects", "src_varname": "osc", "dst_varname": "ghost"}
+    assert mirror.apply_command(connect)
+    assert ("osc", 0, "ghost", 0) not in mirror.lines
+    assert mirror.unconfirmed == 1
+
+
+def test_avoid_rect_is_forgotten_with_the_patch():
+    mirror = PatchMirror()
+    mirror.avoid_rect = [0, 0, 100, 100]
+    mirror.load_snapshot(SNAPSHOT)
+    assert mirror.avoid_rect is None
+    mirror.avoid_rect = [0, 0, 100, 100]
+    mirror.invalidate()
+    assert mirror.avoid_rect is None
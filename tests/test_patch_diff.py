@@ -0,0 +1,60 @@
+import pytest
+
+from patch_diff import diff_patch
+
+BOXES = {
+    "osc": {"maxclass": "newobj", "varname": "osc", "patching_rect": [100, 100, 150, 122], "text": "cycle~ 440"},
+    "out": {"maxclass": "newobj", "varname": "out", "patching_rect": [100, 200, 150, 222], "text": "dac~"},
+    "gain": {"maxclass": "flonum", "varname": "gain", "patching_rect": [200, 100, 250, 122], "text": ""},
+}
+LINES = {("osc", 0, "out", 0), ("osc", 0, "out", 1)}
+ATTRIBUTES = {"gain": {"minimum": 0.0}}
+OBJECTS = [
+    {"varname": "osc", "obj_type": "cycle~", "args": [440], "position": [100, 100]},
+    {"ref": "out", "obj_type": "dac~", "args": []},
+    {"varname": "gain", "obj_type": "flonum"},
+]
+CONNECTIONS = [
+    {"src": "osc", "outlet_idx": 0, "dst": "out", "inlet_idx": 0},
+    {"src": "osc", "outlet_idx": 0, "dst": "out", "inlet_idx": 1},
+]
+ATTRIBUTE_SETS = [{"target": "gain", "attr_name": "minimum", "attr_value": 0.0}]
+
+
+def test_unchanged_patch_needs_no_commands():
+    assert diff_patch(BOXES, LINES, ATTRIBUTES, OBJECTS, CONNECTIONS, ATTRIBUTE_SETS) == []
+
+
+def test_changed_arguments_recreate_the_box_with_its_cords():
+    objects = [dict(OBJECTS[0], args=[220]), *OBJECTS[1:]]
+    operations = diff_patch(BOXES, LINES, ATTRIBUTES, objects, CONNECTIONS)
+    assert [op["action"] for op in operations] == [
+        "remove_object",
+        "add_object",
+        "connect_objects",
+        "connect_objects",
+    ]
+    assert operations[1]["args"] == [220]
+    assert operations[1]["position"] == [100, 100]
+
+
+def test_moves_make_one_command():
+    objects = [dict(OBJECTS[0], position=[10, 10]), dict(OBJECTS[1], position=[10, 80]), OBJECTS[2]]
+    operations = diff_patch(BOXES, LINES, ATTRIBUTES, objects, CONNECTIONS)
+    assert operations == [
+        {"action": "move_objects", "positions": {"osc": [10, 10], "out": [10, 80]}}
+    ]
+
+
+def test_prune_removes_undescribed_boxes_only_when_asked():
+    objects, connections = OBJECTS[:2], CONNECTIONS
+    assert diff_patch(BOXES, LINES, ATTRIBUTES, objects, connections) == [
+        {"action": "remove_object", "varname": "gain"}
+    ]
+    assert diff_patch(BOXES, LINES, ATTRIBUTES, objects, connections, prune=False) == []
+
+
+def test_unknown_connection_target():
+    connections = [{"src": "osc", "dst": "nowhere"}]
+    with pytest.raises(ValueError, match="Unknown object: nowhere"):
+        diff_patch(BOXES, LINES, ATTRIBUTES, OBJECTS, connections)
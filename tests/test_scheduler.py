@@ -0,0 +1,99 @@
+import asyncio
+
+from scheduler import REALTIME, Scheduler
+
+WEIGHTS = {"interactive": 4, "bulk": 1}
+
+
+async def send(scheduler, order, name, lane, keys=(), gate=None):
+    async with scheduler.turn(lane, 100, keys):
+        order.append(name)
+        if gate is not None:
+            await gate.wait()
+
+
+def test_fifo_within_each_lane():
+    async def scenario():
+        scheduler = Scheduler(1, WEIGHTS)
+        order, gate = [], asyncio.Event()
+        first = asyncio.ensure_future(send(scheduler, order, "first", "interactive", gate=gate))
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.ensure_future(send(scheduler, order, f"{lane}-{i}", lane))
+            for i in range(3)
+            for lane in ("bulk", "interactive")
+        ]
+        await asyncio.sleep(0)
+        assert order == ["first"]
+        gate.set()
+        await asyncio.gather(first, *tasks)
+        assert scheduler.in_flight == 0
+        return order
+
+    order = asyncio.run(scenario())
+    for lane in ("bulk", "interactive"):
+        assert [n for n in order if n.startswith(lane)] == [f"{lane}-{i}" for i in range(3)]
+
+
+def test_realtime_waits_behind_pending_add_object():
+    async def scenario():
+        scheduler = Scheduler(1, WEIGHTS)
+        order, gate = [], asyncio.Event()
+        first = asyncio.ensure_future(send(scheduler, order, "first", "interactive", gate=gate))
+        await asyncio.sleep(0)
+        add = asyncio.ensure_future(send(scheduler, order, "add osc", "bulk", keys=("osc",)))
+        set_osc = asyncio.ensure_future(send(scheduler, order, "set osc", REALTIME, keys=("osc",)))
+        set_lfo = asyncio.ensure_future(send(scheduler, order, "set lfo", REALTIME, keys=("lfo",)))
+        await asyncio.sleep(0)
+        # realtime messages about other objects are never held back
+        assert order == ["first", "set lfo"]
+        gate.set()
+        await asyncio.gather(first, add, set_osc, set_lfo)
+        return order
+
+    assert asyncio.run(scenario()) == ["first", "set lfo", "add osc", "set osc"]
+
+
+def test_cancelled_waiter_releases_its_slot():
+    async def scenario():
+        scheduler = Scheduler(1, WEIGHTS)
+        order, gate = [], asyncio.Event()
+        first = asyncio.ensure_future(send(scheduler, order, "first", "bulk", gate=gate))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(send(scheduler, order, "waiter", "bulk"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        last = asyncio.ensure_future(send(scheduler, order, "last", "bulk"))
+        gate.set()
+        await asyncio.gather(first, last)
+        assert waiter.cancelled()
+        assert order == ["first", "last"]
+        assert scheduler.in_flight == 0
+        assert scheduler.waiting() == {"interactive": 0, "bulk": 0}
+
+    asyncio.run(scenario())
+
+
+def test_waiter_cancelled_after_its_turn_came_releases_its_slot():
+    async def scenario():
+        scheduler = Scheduler(1, WEIGHTS)
+        order, gate = [], asyncio.Event()
+
+        async def holder():
+            await send(scheduler, order, "first", "bulk", gate=gate)
+            # the slot has just been granted to the waiter, which has not run yet
+            waiter.cancel()
+
+        first = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(send(scheduler, order, "waiter", "bulk"))
+        await asyncio.sleep(0)
+        gate.set()
+        await first
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert waiter.cancelled()
+        assert scheduler.in_flight == 0
+        await send(scheduler, order, "last", "bulk")
+        assert order == ["first", "last"]
+
+    asyncio.run(scenario())
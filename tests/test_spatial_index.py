@@ -0,0 +1,45 @@
+import random
+
+from spatial_index import SpatialGrid
+
+
+def overlaps(a, b) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def test_query_finds_overlapping_rects_only():
+    grid = SpatialGrid(cell_size=50)
+    grid.insert("a", [0, 0, 40, 20])
+    grid.insert("b", [300, 300, 360, 322])
+    grid.insert("a", [100, 100, 140, 120])  # moved
+    assert grid.query([90, 90, 110, 110]) == {"a"}
+    assert grid.query([0, 0, 40, 20]) == set()
+    grid.remove("b")
+    assert grid.query([0, 0, 1000, 1000]) == {"a"}
+
+
+def test_free_anchor_is_used_as_is():
+    grid = SpatialGrid()
+    grid.insert("a", [0, 0, 50, 22])
+    assert grid.find_free([50, 22], [200, 200]) == [200, 200]
+
+
+def test_box_on_the_anchor_pushes_the_position_aside():
+    grid = SpatialGrid()
+    grid.insert("a", [100, 100, 200, 122])
+    # just below the box is closer than beside it
+    assert grid.find_free([50, 22], [120, 100], margin=10) == [120, 132]
+
+
+def test_found_positions_are_free_in_a_crowded_patch():
+    rng = random.Random(7)
+    grid = SpatialGrid()
+    for i in range(500):
+        x, y = rng.randrange(0, 1500), rng.randrange(0, 1500)
+        grid.insert(i, [x, y, x + rng.randrange(30, 120), y + 22])
+    for _ in range(20):
+        anchor = [rng.randrange(0, 1500), rng.randrange(0, 1500)]
+        x, y = grid.find_free([80, 22], anchor, margin=5)
+        rect = [x - 5, y - 5, x + 85, y + 27]
+        assert x >= 0 and y >= 0
+        assert not any(overlaps(rect, other) for other in grid.rects.values())
@@ -0,0 +1,61 @@
+import asyncio
+
+from streaming import ParameterStream
+
+
+def stream(rate: float = 100):
+    sent = []
+
+    async def send(cmd):
+        sent.append(cmd["values"])
+
+    connected = asyncio.Event()
+    connected.set()
+    return ParameterStream(send, connected, rate), sent, connected
+
+
+def test_latest_value_wins():
+    async def scenario():
+        parameters, sent, _ = stream(rate=20)
+        parameters.update({"cutoff": 100})  # sent right away
+        await asyncio.sleep(0)
+        for value in range(101, 200):
+            parameters.update({"cutoff": value, "q": value / 100})
+        await parameters.flush()
+        assert sent == [{"cutoff": 100}, {"cutoff": 199, "q": 1.99}]
+        stats = parameters.stats()
+        assert stats["updates"] == 1 + 2 * 99
+        assert stats["values_sent"] == 3 and stats["pending"] == 0
+        assert stats["coalesced"] == stats["updates"] - 3
+
+    asyncio.run(scenario())
+
+
+def test_rate_is_respected():
+    async def scenario():
+        parameters, sent, _ = stream(rate=50)
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        for value in range(5):
+            parameters.stream("gain").set(value)
+            await parameters.flush()
+        # 4 waits of 1/50 s after the first value
+        assert loop.time() - start >= 4 / 50 * 0.9
+        assert sent == [{"gain": value} for value in range(5)]
+
+    asyncio.run(scenario())
+
+
+def test_values_wait_for_the_connection():
+    async def scenario():
+        parameters, sent, connected = stream()
+        connected.clear()
+        parameters.update({"gain": 1})
+        parameters.update({"gain": 2})
+        await asyncio.sleep(0.05)
+        assert sent == []
+        connected.set()
+        await parameters.flush()
+        assert sent == [{"gain": 2}]
+
+    asyncio.run(scenario())
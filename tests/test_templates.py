@@ -0,0 +1,58 @@
+import pytest
+
+from templates import Template, TemplateRegistry
+
+OPERATIONS = [
+    {"action": "add_object", "position": [0, 0], "obj_type": "cycle~", "args": ["$freq"], "varname": "osc"},
+    {"action": "add_object", "position": [0, 50], "obj_type": "*~", "args": [0.5], "varname": "gain"},
+    {"action": "connect_objects", "src_varname": "osc", "outlet_idx": 0, "dst_varname": "gain", "inlet_idx": 0},
+    {"action": "set_object_attribute", "varname": "gain", "attr_name": "bgcolor", "attr_value": "$color"},
+]
+
+
+def template() -> Template:
+    t = Template("osc", [], params={"freq": 440, "color": [0, 0, 0, 1]})
+    t.prepare([dict(op) for op in OPERATIONS])
+    return t
+
+
+def test_instantiate_renames_offsets_and_fills_parameters():
+    operations, varnames = template().instantiate("v1", [100, 200], {"freq": 220})
+    assert varnames == {"osc": "v1_osc", "gain": "v1_gain"}
+    assert operations[0]["varname"] == "v1_osc"
+    assert operations[0]["position"] == [100, 200]
+    assert operations[0]["args"] == [220]
+    assert operations[1]["position"] == [100, 250]
+    assert operations[2]["src_varname"] == "v1_osc" and operations[2]["dst_varname"] == "v1_gain"
+    assert operations[3]["attr_value"] == [0, 0, 0, 1]  # default
+
+
+def test_instances_do_not_share_lists():
+    t = template()
+    first, _ = t.instantiate("a", [0, 0], {"freq": 1})
+    second, _ = t.instantiate("b", [0, 0])
+    assert first[0]["args"] == [1] and second[0]["args"] == [440]
+    assert t.operations[0]["args"] == ["$freq"]
+
+
+def test_unknown_parameters_are_refused():
+    with pytest.raises(ValueError, match="Unknown parameters for osc: speed"):
+        template().instantiate("a", [0, 0], {"speed": 2})
+
+
+def test_prepare_checks_refs_and_parameters():
+    t = Template("bad", [], params={})
+    with pytest.raises(ValueError, match=r"\$freq is not a parameter"):
+        t.prepare([dict(op) for op in OPERATIONS])
+    t = Template("bad", [], params={"freq": 1, "color": 1})
+    with pytest.raises(ValueError, match="refers to out"):
+        t.prepare([dict(OPERATIONS[0], varname="osc"), dict(OPERATIONS[2], dst_varname="out")])
+
+
+def test_registry_saves_and_reloads(tmp_path):
+    registry = TemplateRegistry(str(tmp_path), lambda t: t.prepare([dict(op) for op in OPERATIONS]))
+    registry.save(Template("osc", [], params={"freq": 440, "color": 0}))
+    assert registry.names() == ["osc"]
+    assert TemplateRegistry(str(tmp_path), registry.prepare).get("osc").params == {"freq": 440, "color": 0}
+    with pytest.raises(ValueError, match="already exists"):
+        registry.save(Template("osc", []))
@@ -0,0 +1,37 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+from docs_index import DocsIndex
+
+DOCS = {"MSP": [{"name": "cycle~"}, {"name": "dac~"}]}
+
+
+@pytest.fixture(autouse=True)
+def docs(tmp_path, monkeypatch):
+    path = tmp_path / "docs.json"
+    path.write_text(json.dumps(DOCS))
+    monkeypatch.setattr(server, "docs_index", DocsIndex(str(path)))
+
+
+def test_unknown_types_with_suggestions():
+    unknown = server.unknown_object_types(["cycle~", "cylce~", "cylce~", None, "qqqqqq"])
+    assert list(unknown) == ["cylce~", "qqqqqq"]
+    assert unknown["cylce~"]["suggestions"] == ["cycle~"]
+    assert unknown["cylce~"]["message"] == "Unknown object type: cylce~ (did you mean cycle~?)"
+    assert unknown["qqqqqq"]["message"].endswith("(did you mean nothing close?)")
+    assert server.check_object_type("dac~") is None
+
+
+def test_rejected_the_same_way_by_every_tool(monkeypatch):
+    monkeypatch.setattr(server, "REJECT_UNKNOWN_OBJECTS", True)
+    calls = [
+        server.add_max_object(None, [0, 0], "cylce~", "osc", []),
+        server.build_subgraph(None, [{"ref": "osc", "obj_type": "cylce~", "position": [0, 0], "args": []}]),
+        server.apply_patch_state(None, [{"varname": "osc", "obj_type": "cylce~"}]),
+    ]
+    for call in calls:
+        with pytest.raises(ValueError, match=r"did you mean cycle~\?"):
+            asyncio.run(call)